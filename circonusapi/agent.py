@@ -0,0 +1,380 @@
+"""
+============
+Submit Agent
+============
+
+Local agent that aggregates metrics from many processes, and forwards them
+through a single CirconusSubmit instance.
+
+Worker processes send samples with AgentClient over UDP or a Unix datagram
+socket. Sends never block: if the agent is not running or the socket buffer
+is full, samples are dropped. The agent aggregates samples per metric and
+period, and submits closed periods.
+
+Run the agent with ./bin/circonus-agent, or from python::
+
+    from circonusapi import agent, circonussubmit
+
+    sub = circonussubmit.CirconusSubmit("<submission url>")
+    agent.AgentServer(sub, "/tmp/circonus-agent.sock", period=60).serve_forever()
+
+In the worker processes::
+
+    client = agent.AgentClient("/tmp/circonus-agent.sock")
+    client.counter("requests", tags={"service": "api"})
+    client.gauge("queue_size", 12)
+    client.histogram("latency", 0.032)
+
+Wire Format
+-----------
+
+Each datagram contains one or more newline separated records::
+
+    <type> <value> <timestamp> <name>
+
+type
+   ``c`` counter (summed), ``g`` gauge (averaged) or ``h`` histogram sample
+timestamp
+   seconds since epoch, or ``-`` for the time the agent received the record
+name
+   metric name including stream tags, may contain spaces
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+
+from . import llhist
+from .circonussubmit import metric_name
+
+#
+# Optional Imports
+#
+
+try:
+    from circllhist import Circllhist
+except ImportError:
+    Circllhist = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+log = logging.getLogger(__name__)
+
+MAX_DATAGRAM = 8192
+
+# Number of histogram samples collected before they are binned
+HISTOGRAM_BUFFER = 256
+
+
+def _socket(address):
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    return socket.socket(family, socket.SOCK_DGRAM)
+
+
+def parse(datagram, now=None):
+    """
+    Parse a datagram into (type, value, ts, name) tuples. Invalid records are skipped.
+    """
+    out = []
+    for line in datagram.decode("utf-8", "replace").splitlines():
+        try:
+            kind, value, ts, name = line.split(" ", 3)
+            if kind not in ("c", "g", "h"):
+                raise ValueError(kind)
+            ts = now if ts == "-" else float(ts)
+            out.append((kind, float(value), ts, name))
+        except ValueError:
+            log.warning("Invalid record: %r", line)
+    return out
+
+
+class AgentServer(object):
+    """Receive, aggregate and forward metrics
+
+    Aggregates of closed periods are submitted by a background thread, so receiving is not
+    blocked by HTTP requests. If a submission fails or is rejected by the trap, the aggregates
+    that were not accepted are kept and submitted again after retry_interval seconds.
+
+    Args:
+       - submit (CirconusSubmit): used for forwarding aggregated metrics
+       - address (str/tuple): path of a Unix datagram socket, or (host, port) for UDP
+       - period (int): aggregation period in seconds
+       - retry_interval (float): seconds to wait after a failed submission
+       - timeout (float): timeout of submission requests in seconds
+       - max_pending (int): maximal number of unsent aggregates. The oldest aggregates are
+         dropped if submissions keep failing.
+
+    Attributes:
+       - received (int): number of valid records received
+       - dropped (int): number of aggregates dropped because max_pending was exceeded
+    """
+
+    def __init__(self, submit, address, period=60, retry_interval=10, timeout=10,
+                 max_pending=100000):
+        self._submit = submit
+        self.address = address
+        self.period = period
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.received = 0
+        self.dropped = 0
+        self._warned = False
+        # (period start, kind, name) -> aggregation state
+        self._acc = {}
+        # start of the oldest open period, nothing is flushed before it is closed
+        self._oldest = None
+        # closed aggregates waiting for submission
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._worker = None
+        self._sock = None
+
+    def bind(self):
+        self._sock = _socket(self.address)
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+        self._sock.bind(self.address)
+        self._sock.settimeout(1)
+
+    def add(self, kind, value, ts, name):
+        """Aggregate a single sample"""
+        start = int(ts // self.period * self.period)
+        if self._oldest is None or start < self._oldest:
+            self._oldest = start
+        key = (start, kind, name)
+        acc = self._acc.get(key)
+        if kind == "h":
+            # Histogram samples are binned on arrival, only bin counts are kept
+            if np is not None:
+                if acc is None:
+                    acc = self._acc[key] = ([], llhist.Histogram())
+                buf = acc[0]
+                buf.append(value)
+                if len(buf) >= HISTOGRAM_BUFFER:
+                    acc[1].insert_many(buf)
+                    del buf[:]
+            elif Circllhist is not None:
+                if acc is None:
+                    acc = self._acc[key] = Circllhist()
+                acc.insert(value)
+            elif not self._warned:
+                log.warning("Neither numpy nor Circllhist available, dropping histograms")
+                self._warned = True
+        elif acc is None:
+            self._acc[key] = [value, 1]
+        else:
+            acc[0] += value
+            acc[1] += 1
+        self.received += 1
+
+    def flush(self, now=None, force=False):
+        """
+        Submit aggregates of all closed periods.
+
+        When serve_forever() is running, aggregates are handed to the submission thread,
+        otherwise they are submitted immediately.
+
+        Args:
+           - now (float): current time, defaults to time.time()
+           - force (boolean): also submit the current period
+
+        Returns:
+           count (int): number of aggregates of closed periods
+        """
+        now = time.time() if now is None else now
+        if self._oldest is None or (not force and now < self._oldest + self.period):
+            return 0
+        keys = [k for k in self._acc if force or k[0] + self.period <= now]
+        closed = [(k, self._close(k[1], self._acc.pop(k))) for k in keys]
+        self._oldest = min((k[0] for k in self._acc), default=None)
+        with self._pending_lock:
+            self._pending.extend(closed)
+            excess = len(self._pending) - self.max_pending
+            if excess > 0:
+                log.warning("Too many unsent aggregates, dropping %d", excess)
+                del self._pending[:excess]
+                self.dropped += excess
+        if self._worker is not None:
+            self._wakeup.set()
+        else:
+            self._send()
+        return len(closed)
+
+    def _close(self, kind, acc):
+        """Return the final aggregate of a closed period"""
+        if kind == "h" and isinstance(acc, tuple):
+            buf, hist = acc
+            if buf:
+                hist.insert_many(buf)
+            return hist
+        return acc
+
+    def _send(self):
+        """Submit pending aggregates. Returns False if the submission failed."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        # A metric has at most one value per request. Requests are sent one by one, so that
+        # only aggregates of requests that were not accepted are submitted again.
+        groups = []
+        seen = {}
+        for item in pending:
+            (start, kind, name), acc = item
+            i = seen.get(name, 0)
+            seen[name] = i + 1
+            if i == len(groups):
+                groups.append([])
+            groups[i].append(item)
+        for i, group in enumerate(groups):
+            try:
+                for (start, kind, name), acc in group:
+                    self._add(start, kind, name, acc)
+                self._submit.submit(reset=True, timeout=self.timeout, raise_errors=True)
+            except Exception as e:
+                unsent = [item for g in groups[i:] for item in g]
+                log.error("Submission of %d aggregates failed: %s", len(unsent), e)
+                with self._pending_lock:
+                    self._pending[:0] = unsent
+                return False
+        return True
+
+    def _add(self, start, kind, name, acc):
+        if kind == "c":
+            self._submit.add_number(start, name, acc[0])
+        elif kind == "g":
+            self._submit.add_number(start, name, acc[0] / acc[1])
+        else:
+            self._submit.add_histogram(start, name, acc)
+
+    def _run_worker(self):
+        ok = True
+        while not self._stopping.is_set():
+            self._wakeup.wait(None if ok else self.retry_interval)
+            self._wakeup.clear()
+            if not self._stopping.is_set():
+                ok = self._send()
+
+    def serve_forever(self):
+        """Receive and forward metrics until interrupted"""
+        if self._sock is None:
+            self.bind()
+        self._stopping.clear()
+        self._worker = threading.Thread(target=self._run_worker, name="circonus-agent-submit")
+        self._worker.daemon = True
+        self._worker.start()
+        try:
+            while True:
+                try:
+                    datagram = self._sock.recv(MAX_DATAGRAM)
+                except socket.timeout:
+                    datagram = None
+                now = time.time()
+                if datagram:
+                    for record in parse(datagram, now):
+                        self.add(*record)
+                self.flush(now)
+        finally:
+            self._stopping.set()
+            self._wakeup.set()
+            self._worker.join()
+            self._worker = None
+            self.flush(force=True)
+            self._send()
+            self.close()
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            if isinstance(self.address, str) and os.path.exists(self.address):
+                os.unlink(self.address)
+
+
+class AgentClient(object):
+    """Send metrics to an AgentServer. Sends never block, samples are dropped on failure.
+
+    Args:
+       - address (str/tuple): path of a Unix datagram socket, or (host, port) for UDP
+       - buffer_size (int): collect records up to this many bytes before sending.
+         0 sends every record immediately. Call flush() to send buffered records.
+
+    Attributes:
+       - dropped (int): number of datagrams that could not be sent
+    """
+
+    def __init__(self, address, buffer_size=0):
+        self.address = address
+        self.buffer_size = min(buffer_size, MAX_DATAGRAM)
+        self.dropped = 0
+        self._sock = _socket(address)
+        self._sock.setblocking(False)
+        self._buf = []
+        self._buf_len = 0
+        self._names = {}
+
+    def _name(self, name, tags):
+        if not tags:
+            return name
+        key = (name, tuple(sorted(tags.items())))
+        full = self._names.get(key)
+        if full is None:
+            full = self._names[key] = metric_name(name, tags)
+        return full
+
+    def _send(self, data):
+        try:
+            self._sock.sendto(data, self.address)
+        except (OSError, socket.error):
+            self.dropped += 1
+
+    def send(self, kind, name, value, ts=None, tags=None):
+        """
+        Send a single sample.
+
+        Args:
+           - kind (str): "c", "g" or "h"
+           - name (str): metric name
+           - value (number): sample value
+           - ts (number, optional): timestamp, defaults to the time the agent receives the sample
+           - tags (dict, optional): stream tags
+        """
+        record = "{} {!r} {} {}\n".format(
+            kind, float(value), "-" if ts is None else repr(float(ts)), self._name(name, tags)
+        ).encode("utf-8")
+        if not self.buffer_size:
+            self._send(record)
+            return
+        if self._buf_len + len(record) > self.buffer_size:
+            self.flush()
+        self._buf.append(record)
+        self._buf_len += len(record)
+
+    def flush(self):
+        """Send buffered records"""
+        if self._buf:
+            self._send(b"".join(self._buf))
+            self._buf = []
+            self._buf_len = 0
+
+    def counter(self, name, value=1, ts=None, tags=None):
+        """Add value to a counter. Counters are summed per period."""
+        self.send("c", name, value, ts, tags)
+
+    def gauge(self, name, value, ts=None, tags=None):
+        """Record a gauge value. Gauges are averaged per period."""
+        self.send("g", name, value, ts, tags)
+
+    def histogram(self, name, value, ts=None, tags=None):
+        """Record a sample. Samples are collected into a histogram per period."""
+        self.send("h", name, value, ts, tags)
+
+    def close(self):
+        self.flush()
+        self._sock.close()
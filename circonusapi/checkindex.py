@@ -0,0 +1,197 @@
+"""
+==================
+Check Bundle Index
+==================
+
+In-memory index over check bundle objects, for answering lookups locally.
+
+Check bundles are indexed by tags, tag categories, type, target, brokers and
+metric names. All criteria accept exact values or glob patterns
+(``*``, ``?``, ``[...]``). Patterns with a literal prefix only scan the
+matching range of the index.
+
+Example
+-------
+
+::
+
+    from circonusapi import circonusapi, checkindex
+
+    api = circonusapi.CirconusAPI(token)
+    index = checkindex.CheckBundleIndex(api.list_check_bundle())
+
+    # All check bundles tagged env:prod with metrics matching duration*
+    bundles = index.search(tags=["env:prod"], metric="duration*")
+
+    # Keep the index up to date
+    index.add(api.edit_check_bundle(1234, data))
+    index.remove("/check_bundle/1234")
+
+"""
+
+import bisect
+import threading
+from fnmatch import fnmatchcase
+
+FIELDS = ("tag", "category", "type", "target", "broker", "metric")
+
+
+def _is_glob(pattern):
+    return any(c in pattern for c in "*?[")
+
+
+def _keys(bundle):
+    """Return index keys of a bundle as (field, value) pairs"""
+    tags = bundle.get("tags") or []
+    yield "type", bundle.get("type")
+    yield "target", bundle.get("target")
+    for tag in tags:
+        yield "tag", tag
+        yield "category", tag.split(":", 1)[0]
+    for broker in bundle.get("brokers") or []:
+        yield "broker", broker
+    for metric in bundle.get("metrics") or []:
+        yield "metric", metric.get("name") if isinstance(metric, dict) else metric
+
+
+class _FieldIndex(object):
+    """Inverted index value -> set of cids, with sorted values for prefix scans"""
+
+    def __init__(self):
+        self.postings = {}
+        # sorted once on the first glob lookup, then maintained incrementally
+        self._sorted = None
+
+    def add(self, value, cid):
+        if value is None:
+            return
+        if value not in self.postings:
+            self.postings[value] = set()
+            if self._sorted is not None:
+                bisect.insort(self._sorted, value)
+        self.postings[value].add(cid)
+
+    def discard(self, value, cid):
+        cids = self.postings.get(value)
+        if cids is None:
+            return
+        cids.discard(cid)
+        if not cids:
+            del self.postings[value]
+            if self._sorted is not None:
+                del self._sorted[bisect.bisect_left(self._sorted, value)]
+
+    def values(self, pattern):
+        """Return indexed values matching pattern"""
+        if not _is_glob(pattern):
+            return [pattern] if pattern in self.postings else []
+        if self._sorted is None:
+            self._sorted = sorted(self.postings)
+        prefix = pattern
+        for i, c in enumerate(pattern):
+            if c in "*?[":
+                prefix = pattern[:i]
+                break
+        lo = bisect.bisect_left(self._sorted, prefix)
+        out = []
+        for value in self._sorted[lo:]:
+            if not value.startswith(prefix):
+                break
+            if fnmatchcase(value, pattern):
+                out.append(value)
+        return out
+
+    def lookup(self, pattern):
+        values = self.values(pattern)
+        if len(values) == 1:
+            return self.postings[values[0]]
+        return set().union(*[self.postings[v] for v in values])
+
+
+class CheckBundleIndex(object):
+    """Index over check bundle objects
+
+    Args:
+       - bundles (list, optional): check bundles, e.g. result of api.list_check_bundle()
+    """
+
+    def __init__(self, bundles=()):
+        self._lock = threading.RLock()
+        self._bundles = {}
+        self._index = dict((f, _FieldIndex()) for f in FIELDS)
+        for bundle in bundles:
+            self.add(bundle)
+
+    def __len__(self):
+        return len(self._bundles)
+
+    def __contains__(self, cid):
+        return cid in self._bundles
+
+    def get(self, cid):
+        """Return the indexed bundle with the given _cid, or None"""
+        return self._bundles.get(cid)
+
+    def add(self, bundle):
+        """
+        Add or replace a check bundle, e.g. from a get_check_bundle() or edit_check_bundle() response.
+        """
+        cid = bundle["_cid"]
+        with self._lock:
+            self.remove(cid)
+            self._bundles[cid] = bundle
+            for field, value in _keys(bundle):
+                self._index[field].add(value, cid)
+
+    def remove(self, cid):
+        """Remove the check bundle with the given _cid, if indexed"""
+        with self._lock:
+            bundle = self._bundles.pop(cid, None)
+            if bundle is None:
+                return
+            for field, value in _keys(bundle):
+                self._index[field].discard(value, cid)
+
+    def values(self, field, pattern="*"):
+        """
+        Return distinct indexed values of a field matching a pattern.
+
+        Args:
+           - field (str): one of tag, category, type, target, broker, metric
+           - pattern (str): value or glob pattern
+        """
+        with self._lock:
+            return self._index[field].values(pattern)
+
+    def lookup(self, tags=(), category=None, type=None, target=None, broker=None, metric=None):
+        """
+        Return the set of _cids of bundles matching all given criteria.
+
+        Args:
+           - tags (list): tags, e.g. ["env:prod", "team:*"], all must match
+           - category (str): tag category, e.g. "env"
+           - type (str): check type, e.g. "httptrap"
+           - target (str): check target
+           - broker (str): broker _cid, e.g. "/broker/35"
+           - metric (str): metric name, e.g. "duration*"
+        """
+        criteria = [("tag", t) for t in tags]
+        criteria += [
+            (field, pattern) for field, pattern in [
+                ("category", category), ("type", type), ("target", target),
+                ("broker", broker), ("metric", metric)
+            ] if pattern is not None
+        ]
+        with self._lock:
+            if not criteria:
+                return set(self._bundles)
+            sets = [self._index[field].lookup(pattern) for field, pattern in criteria]
+            sets.sort(key=len)
+            return sets[0].intersection(*sets[1:])
+
+    def search(self, **criteria):
+        """
+        Return bundles matching all given criteria, ordered by _cid. See lookup().
+        """
+        with self._lock:
+            return [self._bundles[cid] for cid in sorted(self.lookup(**criteria))]
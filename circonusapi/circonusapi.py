@@ -114,6 +114,9 @@ import time
 
 from contextlib import closing
 
+from . import codec
+from . import singleflight
+
 try:
     from urllib.request import Request, urlopen
     from urllib.parse import quote, urlencode
@@ -132,7 +135,7 @@ class CirconusAPI(object):
     """CirconusAPI Class"""
 
     def __init__(self, token, baseurl='https://api.circonus.com', appname='python-circonusapi',
-                 debug=False):
+                 debug=False, compress_requests=False, coalesce=False):
         """Create a CirconusAPI object.
 
         Args:
@@ -142,12 +145,18 @@ class CirconusAPI(object):
            - baseurl (str) : URL of Circonus API endpoint to connect to.
            - appname (str) : Appname to use for authentification against the API
            - debug (boolean) : Turn on/off debugging
+           - compress_requests (boolean) : gzip compress request bodies
+           - coalesce (boolean) : Let concurrent identical GET requests share a
+             single in-flight request. Results are shared and must not be modified.
+             See circonusapi.singleflight.
 
         """
         self.debug = False # Set api.debug = True to enable debug messages
         self.baseurl = baseurl
         self.appname = appname
         self.token = token
+        self.compress_requests = compress_requests
+        self.singleflight = singleflight.SingleFlight() if coalesce else None
         self.endpoints = [
             'check_bundle',
             'rule_set',
@@ -214,7 +223,7 @@ class CirconusAPI(object):
             raise AttributeError("%s instance has no attribute '%s'" % (
                 self.__class__.__name__, name))
 
-    def api_call(self, method, endpoint, data=None, params=None):
+    def api_call(self, method, endpoint, data=None, params=None, decoder=None):
         """
         Performs a circonus api call.
 
@@ -223,18 +232,31 @@ class CirconusAPI(object):
           - endpoint (str) : Endpoint to request, e.g. "/checks"
           - data (str/dict) : Payload to send
           - params (dict) : Query string parameters
+          - decoder (callable) : Function that decodes the response body from a
+            binary file-like object, e.g. circonusapi.df4.load. Defaults to
+            reading the full body and parsing it as JSON.
 
         """
 
         # Encode data as json if it isn't already. You can pass a json encoded
         # string or python dict here.
         if isinstance(data, dict):
-            data = json.dumps(data)
+            data = codec.dumps(data)
 
         # converting str to bytes in PY3 or str to str PY2
-        if data:
+        if data and not isinstance(data, bytes):
             data = data.encode('utf-8')
 
+        headers = {
+            "X-Circonus-Auth-Token": self.token,
+            "X-Circonus-App-Name": self.appname,
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Accept-Encoding": codec.ACCEPT_ENCODING}
+        if data and self.compress_requests:
+            data = codec.compress(data)
+            headers["Content-Encoding"] = "gzip"
+
         # Allow specifying an endpoint both with and without a leading /
         endpoint = endpoint.lstrip('/')
         endpoint = quote(endpoint)
@@ -242,19 +264,30 @@ class CirconusAPI(object):
             endpoint = '%s?%s' % (endpoint, urlencode(
                 [(i, params[i]) for i in params]))
         url = "%s/v2/%s" % (self.baseurl, endpoint)
-        req = Request(url=url, data=data,
-            headers={
-                "X-Circonus-Auth-Token": self.token,
-                "X-Circonus-App-Name": self.appname,
-                "Content-Type": "application/json",
-                "Accept": "application/json"})
+        if self.singleflight is not None and method == "GET":
+            # decoders change the type of the response, so they are part of the key
+            return self.singleflight.do((method, url, data, decoder), self._send,
+                                        method, url, data, headers, decoder)
+        return self._send(method, url, data, headers, decoder)
+
+    def _send(self, method, url, data, headers, decoder):
+        req = Request(url=url, data=data, headers=headers)
         req.get_method = lambda: method
         for i in range(5):
             # Retry 5 times until we succeed
             try:
                 with closing(urlopen(req)) as fh:
-                    response_data = fh.read().decode('utf-8')
                     code = fh.code
+                    if code == 204:
+                        # Deal with empty response
+                        response = {}
+                    else:
+                        body = codec.decoding_reader(
+                            fh, fh.info().get('Content-Encoding'))
+                        if decoder:
+                            response = decoder(body)
+                        else:
+                            response = codec.loads(body.read())
                     # We succeeded, exit the for loop
                     break
             except HTTPError as e:
@@ -270,9 +303,10 @@ class CirconusAPI(object):
                     continue
                 # Deal with other API errors
                 try:
-                    response_data = e.read().decode('utf-8')
+                    response_data = codec.decoding_reader(
+                        e, e.info().get('Content-Encoding')).read()
                     e.close()
-                    data_dict = json.loads(response_data)
+                    data_dict = codec.loads(response_data)
                 except ValueError:
                     data_dict = {}
                 raise CirconusAPIError(e.code, data_dict, debug=self.debug)
@@ -286,13 +320,8 @@ class CirconusAPI(object):
             raise RateLimitRetryExceeded()
 
         if self.debug:
-            log.debug("data: %s", str(response_data))
+            log.debug("data: %s", str(response))
 
-        if code == 204:
-            # Deal with empty response
-            response = {}
-        else:
-            response = json.loads(response_data)
         # Deal with the unlikely case that we get an error with a 200 return
         # code
         if isinstance(response, dict) and not response.get('success', True):
@@ -57,11 +57,18 @@ More examples can be found in the ./examples folder in this repository.
 """
 
 import math
+import threading
+from collections import OrderedDict
+from contextlib import closing
 from datetime import datetime
 import warnings
 import requests
 
 from . import circonusapi
+from . import codec
+from . import df4
+from . import llhist
+from . import singleflight
 
 #
 # Optional Imports
@@ -77,19 +84,50 @@ try:
 except ImportError:
     pd = None
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _load_df4_numeric(fh):
+    # module-level, so that identical requests share a coalescing key in CirconusAPI
+    return df4.load(fh, numeric_arrays=True)
+
+
+def _dataframe(res):
+    head = res['head']
+    meta = res['meta'] or []
+    data = res['data']
+    return pd.DataFrame(
+        data,
+        columns = [
+            datetime.fromtimestamp(head['start'] + i * head['period'])
+            for i in range(head['count'])
+        ],
+        index = [ m['label'] for m in meta ],
+    ).transpose()
+
 
 class CirconusData(object):
     """Circonus data fetching class.
 
     Direct constructor calls should be avoided.
-    Use the provided factory methods .from_api() / .from_irondb() to create instances of this class.
+    Use the provided factory methods .from_api() / .from_irondb() to create instances of this class,
+    or registry.get_data() to use instances shared across the process.
     """
 
 
-    def __init__(self, token=None, endpoint=None, account=1):
-        if token:
+    def __init__(self, token=None, endpoint=None, account=1, compress_requests=False,
+                 coalesce=False, api=None):
+        self._compress_requests = compress_requests
+        self.singleflight = singleflight.SingleFlight() if coalesce else None
+        if api:
             self._mode = "API"
-            self._api = circonusapi.CirconusAPI(token)
+            self._api = api
+        elif token:
+            self._mode = "API"
+            self._api = circonusapi.CirconusAPI(token, compress_requests=compress_requests)
         elif endpoint:
             self._mode = "IRONdb"
             self._endpoint = endpoint
@@ -98,17 +136,20 @@ class CirconusData(object):
             raise Exception("No token/endpoint given")
 
     @classmethod
-    def from_api(cls, token):
+    def from_api(cls, token, compress_requests=False, coalesce=False):
         """
         Connect to the Circonus API with a token
 
         Args:
-           token (str): Circonus API token
+           - token (str): Circonus API token
+           - compress_requests (boolean): gzip compress request bodies
+           - coalesce (boolean): let concurrent identical caql() calls share a single request.
+             Results are shared and must not be modified.
         """
-        return cls(token = token)
+        return cls(token = token, compress_requests = compress_requests, coalesce = coalesce)
 
     @classmethod
-    def from_irondb(cls, endpoint, account=1):
+    def from_irondb(cls, endpoint, account=1, compress_requests=False, coalesce=False):
         """
         Connect to an IRONdb node, instead of a CirconusAPI endpoint
 
@@ -116,28 +157,47 @@ class CirconusData(object):
            - endpoint (str): IRONdb node URL, in the form "<protocol>://<hostname/ip>:<port>",
              e.g. "http://localhost:8112"
            - account (int): account id to use for CAQL requests.
+           - compress_requests (boolean): gzip compress request bodies
+           - coalesce (boolean): let concurrent identical caql() calls share a single request.
+             Results are shared and must not be modified.
 
         Notes:
            The current implementation will issue all requests against a single node.
         """
-        return cls(endpoint = endpoint, account = account)
+        return cls(endpoint = endpoint, account = account, compress_requests = compress_requests,
+                   coalesce = coalesce)
 
-    def _caql_request(self, params):
+    def _caql_request(self, params, numeric_arrays=False):
+        # Responses are decoded incrementally from the socket, see df4.load()
+        decoder = _load_df4_numeric if numeric_arrays else df4.load
         if self._mode == "API":
-            return self._api.api_call("GET", "/caql", params=params)
+            return self._api.api_call("GET", "/caql", params=params, decoder=decoder)
         elif self._mode == "IRONdb":
             params = dict(params) # copy
             params['account_id'] = self._account
+            headers = {
+                "Content-Type": "application/json",
+                "Accept-Encoding": codec.ACCEPT_ENCODING,
+            }
+            body = codec.dumps(params)
+            if self._compress_requests:
+                body = codec.compress(body)
+                headers["Content-Encoding"] = "gzip"
             resp = requests.post(
                 self._endpoint + "/extension/lua/caql_v1",
-                json=params
+                data=body,
+                headers=headers,
+                stream=True
             )
-            if resp.status_code == 200:
-                return resp.json()
-            else:
-                raise Exception(resp.text)
-
-    def caql(self, query, start, period, count, convert_hists = True, explain=False):
+            with closing(resp):
+                if resp.status_code == 200:
+                    resp.raw.decode_content = True
+                    return decoder(resp.raw)
+                else:
+                    raise Exception(resp.text)
+
+    def caql(self, query, start, period, count, convert_hists = True, explain=False,
+             numeric_arrays=False):
         """
         Fetch data using CAQL.
 
@@ -149,6 +209,8 @@ class CirconusData(object):
            - count (int): number of datapoints to fetch
            - convert_hists (boolean, optional): Convert returned histograms to
              Circllhist objects. Requires Circllhist to be available.
+           - numeric_arrays (boolean, optional): Return numeric series as preallocated
+             array('d') objects instead of lists. Missing values are represented as NaN.
 
         Returns:
            res (dict): result in DF4 format. Example::
@@ -176,7 +238,13 @@ class CirconusData(object):
             "end": int(start + count * period),
             "format" : "DF4"
         }
-        res = self._caql_request(params)
+        if self.singleflight is not None:
+            key = tuple(sorted(params.items())) + (convert_hists, numeric_arrays)
+            return self.singleflight.do(key, self._caql, params, convert_hists, numeric_arrays)
+        return self._caql(params, convert_hists, numeric_arrays)
+
+    def _caql(self, params, convert_hists, numeric_arrays):
+        res = self._caql_request(params, numeric_arrays)
 
         # In the case of 0 output metrics, res['meta']/res['data'] might be None
         if not res['meta']: res['meta'] = []
@@ -208,15 +276,372 @@ class CirconusData(object):
         """
         if not pd:
             raise ImportError("pandas not available")
-        res = self.caql(*args, **kwargs)
-        head = res['head']
-        meta = res['meta'] or []
-        data = res['data'] or []
-        return pd.DataFrame(
-            data,
-            columns = [
-                datetime.fromtimestamp(head['start'] + i * head['period'])
-                for i in range(head['count'])
-            ],
-            index = [ m['label'] for m in meta ],
-        ).transpose()
+        kwargs.setdefault("numeric_arrays", True)
+        return _dataframe(self.caql(*args, **kwargs))
+
+
+    def caqldf_iter(self, query, start, period, count, max_cells=2**20, chunk_count=None,
+                    **kwargs):
+        """
+        Fetch CAQL as a sequence of pandas DataFrames of bounded size.
+
+        Results that do not fit into memory as a single DataFrame can be processed chunk
+        by chunk, e.g. with StreamReducer. Output streams are paged by passing a list of
+        queries, each selecting a part of the streams, e.g. find() queries with different
+        tag filters. Time is paged by fetching at most chunk_count datapoints per request.
+
+        Example::
+
+            queries = [ 'find("duration", "and(host:web{}*)")'.format(i) for i in range(10) ]
+            reducer = circonusdata.StreamReducer(quantiles=[0.5, 0.99])
+            for df in circ.caqldf_iter(queries, datetime(2020, 1, 1), 60, 60 * 24 * 7):
+                reducer.update(df)
+            summary = reducer.result()
+
+        Args:
+           - query (str/list): the CAQL query string, or a list of query strings.
+             Queries are fetched one after another.
+           - start (int/datetime): starttime of the query
+           - period (int): period of data to fetch
+           - count (int): number of datapoints to fetch
+           - max_cells (int): maximal number of values (streams * datapoints) per DataFrame.
+             The number of streams is not known before the first request of each query,
+             so the first chunk of a query contains a single datapoint. Queries with more
+             than max_cells streams yield one datapoint per chunk.
+           - chunk_count (int, optional): number of datapoints per request.
+             Overrides max_cells.
+           - kwargs: passed to caql()
+
+        Yields:
+           df (DataFrame): see caqldf(). Columns are the output streams of one query, rows
+           cover consecutive time ranges.
+        """
+        if not pd:
+            raise ImportError("pandas not available")
+        if isinstance(query, str):
+            query = [query]
+        if isinstance(start, datetime):
+            start = start.timestamp()
+        start = int(start) // int(period) * int(period)
+        kwargs.setdefault("numeric_arrays", True)
+        for q in query:
+            i = 0
+            n = chunk_count or 1
+            while i < count:
+                n = min(n, count - i)
+                res = self.caql(q, start + i * period, period, n, **kwargs)
+                i += n
+                if not chunk_count:
+                    n = max(1, max_cells // max(1, len(res['meta'])))
+                yield _dataframe(res)
+
+
+class StreamReducer(object):
+    """Compute per-stream aggregates of DataFrames incrementally.
+
+    Only count, sum, minimum, maximum and a histogram of each stream are kept, so memory usage
+    does not grow with the number of datapoints. Quantiles are approximated with log-linear
+    histograms (see circonusapi.llhist), with a relative error below 10%.
+
+    Streams are identified by column label. Columns with the same label are combined.
+    Non-numeric columns and missing values are ignored. Requires numpy and pandas.
+
+    Example::
+
+        reducer = circonusdata.StreamReducer(quantiles=[0.5, 0.99])
+        for df in circ.caqldf_iter(query, start, 60, 60 * 24 * 30):
+            reducer.update(df)
+        reducer.result()
+
+        #         count     sum  mean  min   max   p50   p99
+        # web1    43200  129600   3.0    1    12   3.0  10.5
+        # web2    43200  172800   4.0    1    15   4.0  12.5
+
+    Args:
+       - quantiles (list): quantiles to compute, between 0 and 1. Empty disables histograms.
+    """
+
+    def __init__(self, quantiles=(0.5, 0.9, 0.99)):
+        if np is None or pd is None:
+            raise ImportError("numpy and pandas required")
+        self.quantiles = list(quantiles)
+        self._labels = {}
+        self._count = np.zeros(0)
+        self._sum = np.zeros(0)
+        self._min = np.zeros(0)
+        self._max = np.zeros(0)
+        # sorted packed (stream, bin key) values and their counts, see llhist.encode_groups()
+        self._bins = np.zeros(0, dtype=np.int64)
+        self._bin_counts = np.zeros(0)
+
+    def _streams(self, labels):
+        """Return stream index of each label, allocating new streams"""
+        for label in labels:
+            self._labels.setdefault(label, len(self._labels))
+        n = len(self._labels) - len(self._count)
+        if n:
+            self._count = np.concatenate([self._count, np.zeros(n)])
+            self._sum = np.concatenate([self._sum, np.zeros(n)])
+            self._min = np.concatenate([self._min, np.full(n, np.nan)])
+            self._max = np.concatenate([self._max, np.full(n, np.nan)])
+        return np.array([self._labels[label] for label in labels], dtype=np.int64)
+
+    def update(self, df):
+        """
+        Add the values of a DataFrame, e.g. a chunk yielded by CirconusData.caqldf_iter().
+
+        Returns:
+           self
+        """
+        if all(pd.api.types.is_numeric_dtype(t) for t in df.dtypes):
+            labels, values = list(df.columns), df.to_numpy(dtype=float).T
+        else:
+            # results with histogram streams have object columns
+            labels, values = [], []
+            for i, label in enumerate(df.columns):
+                try:
+                    values.append(df.iloc[:, i].to_numpy(dtype=float))
+                except (TypeError, ValueError):
+                    continue
+                labels.append(label)
+            values = np.array(values).reshape(len(labels), len(df.index))
+        streams = self._streams(labels)
+        ok = ~np.isnan(values)
+        seen = ok.any(axis=1)
+        np.add.at(self._count, streams, ok.sum(axis=1))
+        np.add.at(self._sum, streams, np.sum(values, axis=1, where=ok))
+        np.fmin.at(self._min, streams[seen],
+                   np.min(values[seen], axis=1, initial=np.inf, where=ok[seen]))
+        np.fmax.at(self._max, streams[seen],
+                   np.max(values[seen], axis=1, initial=-np.inf, where=ok[seen]))
+        values = values[ok]
+        idx = np.repeat(streams, len(df.index))[ok.ravel()]
+        if self.quantiles and len(values):
+            keys, keep = llhist._bin_keys(values)
+            packed = np.concatenate([
+                self._bins, idx[keep] * llhist._KEY_SPAN + keys[keep] + llhist._KEY_MAX])
+            weights = np.concatenate([self._bin_counts, np.ones(int(keep.sum()))])
+            self._bins, inverse = np.unique(packed, return_inverse=True)
+            self._bin_counts = np.bincount(inverse.ravel(), weights=weights)
+        return self
+
+    def _quantiles(self):
+        out = np.full((len(self._count), len(self.quantiles)), np.nan)
+        if not len(self._bins):
+            return out
+        streams, keys = np.divmod(self._bins, llhist._KEY_SPAN)
+        lower, width = llhist._key_bounds(keys - llhist._KEY_MAX)
+        cum = np.cumsum(self._bin_counts)
+        first = np.searchsorted(streams, np.arange(len(self._count)), side="left")
+        last = np.searchsorted(streams, np.arange(len(self._count)), side="right") - 1
+        has = last >= first
+        first, last = first[has], last[has]
+        before = cum[first] - self._bin_counts[first]
+        total = cum[last] - before
+        for j, q in enumerate(self.quantiles):
+            target = before + q * total
+            i = np.clip(np.searchsorted(cum, target, side="left"), first, last)
+            frac = (target - (cum[i] - self._bin_counts[i])) / self._bin_counts[i]
+            out[has, j] = lower[i] + np.clip(frac, 0, 1) * width[i]
+        # estimates cannot lie outside the exact range of the stream
+        return np.clip(out, self._min[:, None], self._max[:, None])
+
+    def result(self):
+        """
+        Return aggregates as DataFrame with one row per stream, and columns count, sum, mean,
+        min, max and one column per quantile, e.g. p50, p99.
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self._sum / self._count
+        df = pd.DataFrame({
+            "count": self._count, "sum": self._sum, "mean": mean,
+            "min": self._min, "max": self._max,
+        }, index=list(self._labels))
+        for q, values in zip(self.quantiles, self._quantiles().T):
+            df["p{:g}".format(q * 100)] = values
+        return df
+
+class RollupCache(object):
+    """Serve numeric CAQL results at multiple resolutions from a single fetch.
+
+    Data is fetched once at base_period. Requests for coarser periods (multiples of base_period)
+    are answered by downsampling the base data on the client. Downsampled resolutions are kept in
+    memory, until the memory budget is exceeded and the least recently used entries are evicted.
+
+    Only numeric output streams are retained. Requires numpy.
+
+    Example::
+
+        rollup = circonusdata.RollupCache(circ, base_period=60)
+
+        # Fetches 7 days of data at 1 minute resolution
+        week = rollup.caqldf(query, datetime(2020, 1, 1), 3600, 24 * 7)
+
+        # Served from the cache
+        day = rollup.caqldf(query, datetime(2020, 1, 3), 600, 6 * 24, agg="max")
+        hour = rollup.caqldf(query, datetime(2020, 1, 3, 12), 60, 60)
+
+    Args:
+       - circ (CirconusData): used to fetch base data
+       - base_period (int): period of fetched data
+       - budget (int): maximal memory used for cached data in bytes. Data that does not fit
+         into the budget is not cached.
+
+    Attributes:
+       - hits (int): number of requests served from cache
+       - misses (int): number of requests that required a fetch
+    """
+
+    AGGREGATES = ("mean", "min", "max", "sum", "count")
+
+    def __init__(self, circ, base_period=60, budget=256 * 2**20):
+        if np is None:
+            raise ImportError("numpy not available")
+        self._circ = circ
+        self.base_period = int(base_period)
+        self.budget = budget
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # ("base", query) / ("level", query, period, agg) -> (start, meta, array)
+        self._entries = OrderedDict()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry):
+        if entry[2].nbytes > self.budget:
+            return
+        with self._lock:
+            if key[0] == "base":
+                # downsampled data of the previous base range are invalid
+                for k in [ k for k in self._entries if k[1] == key[1] ]:
+                    self.nbytes -= self._entries.pop(k)[2].nbytes
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2].nbytes
+            self._entries[key] = entry
+            self.nbytes += entry[2].nbytes
+            while self.nbytes > self.budget:
+                self.nbytes -= self._entries.popitem(last=False)[1][2].nbytes
+
+    def clear(self):
+        """Drop all cached data"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _fetch(self, query, start, end, base):
+        if base is not None:
+            b_start, _, b_data = base
+            b_end = b_start + b_data.shape[1] * self.base_period
+            if start <= b_end and end >= b_start:
+                # Fetch the union of the cached and requested range, if they overlap or touch.
+                # Distant ranges replace the cached range.
+                start = min(start, b_start)
+                end = max(end, b_end)
+        start = start // self.base_period * self.base_period
+        count = int(math.ceil((end - start) / self.base_period))
+        res = self._circ.caql(query, start, self.base_period, count,
+                              convert_hists=False, numeric_arrays=True)
+        idx = [ i for i, m in enumerate(res['meta']) if m['kind'] == "numeric" ]
+        data = np.full((len(idx), count), np.nan)
+        for row, i in enumerate(idx):
+            series = np.asarray(res['data'][i], dtype=float)[:count]
+            data[row, :len(series)] = series
+        return (int(res['head']['start']), [ res['meta'][i] for i in idx ], data)
+
+    def _downsample(self, base, period, agg):
+        b_start, meta, data = base
+        factor = period // self.base_period
+        # buckets are aligned on multiples of period
+        origin = b_start + (-b_start) % period
+        offset = (origin - b_start) // self.base_period
+        n = max(0, (data.shape[1] - offset) // factor)
+        cube = data[:, offset:offset + n * factor].reshape(data.shape[0], n, factor)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if agg == "min":
+                out = np.fmin.reduce(cube, axis=2)
+            elif agg == "max":
+                out = np.fmax.reduce(cube, axis=2)
+            else:
+                counts = np.sum(~np.isnan(cube), axis=2).astype(float)
+                if agg == "count":
+                    out = counts
+                else:
+                    out = np.nansum(cube, axis=2)
+                    if agg == "mean":
+                        out /= counts
+                    out[counts == 0] = np.nan
+        return (origin, meta, out)
+
+    def caql(self, query, start, period, count, agg="mean"):
+        """
+        Fetch numeric CAQL data at the given resolution.
+
+        Args:
+           - query (str): the CAQL query string
+           - start (int/datetime): starttime of the query
+           - period (int): period of data, multiple of base_period
+           - count (int): number of datapoints
+           - agg (str): aggregation used for downsampling: mean, min, max, sum or count
+
+        Returns:
+           res (dict): result in DF4 format. res['data'] is a 2d numpy array with one row per
+           output stream.
+        """
+        if agg not in self.AGGREGATES:
+            raise ValueError("Unknown aggregation {}".format(agg))
+        period = int(period)
+        if period % self.base_period:
+            raise ValueError("period {} is not a multiple of base_period {}".format(
+                period, self.base_period))
+        if isinstance(start, datetime):
+            start = start.timestamp()
+        start = int(start) // period * period
+        end = start + count * period
+        if period == self.base_period:
+            agg = "mean"  # no aggregation needed, base data is returned
+
+        def covers(entry, p):
+            return entry is not None and entry[0] <= start and \
+                entry[0] + entry[2].shape[1] * p >= end
+
+        key = ("level", query, period, agg)
+        level = self._get(key)
+        if covers(level, period):
+            self.hits += 1
+        else:
+            base = self._get(("base", query))
+            if covers(base, self.base_period):
+                self.hits += 1
+            else:
+                self.misses += 1
+                base = self._fetch(query, start, end, base)
+                self._put(("base", query), base)
+            if period == self.base_period:
+                level = base
+            else:
+                level = self._downsample(base, period, agg)
+                self._put(key, level)
+        l_start, meta, data = level
+        i = (start - l_start) // period
+        return {
+            "version": "DF4",
+            "head": { "count": count, "start": start, "period": period },
+            "meta": meta,
+            "data": data[:, i:i + count],
+        }
+
+    def caqldf(self, *args, **kwargs):
+        """
+        Like caql(), but returns a pandas DataFrame. See CirconusData.caqldf().
+        """
+        if not pd:
+            raise ImportError("pandas not available")
+        return _dataframe(self.caql(*args, **kwargs))
@@ -29,15 +29,27 @@ Example
     # Submit batch of data
     sub.submit()
 
+    # Hot path: Pre-resolved metric handles
+    latency = sub.metric("latency", tags={"service": "api", "host": "web1"})
+    latency.record(12.3)   # timestamp defaults to now
+    sub.submit()
+
 """
 
+import base64
+import re
 import sys
 import random
 import string
+import threading
+import time
 import requests
+from array import array
 from datetime import datetime, timezone
 
 from . import circonusapi
+from . import codec
+from . import llhist
 #
 # Optional Imports
 #
@@ -47,23 +59,113 @@ try:
 except ImportError:
     Circllhsit = None
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Characters allowed in stream tags without base64 encoding
+_TAG_PLAIN = re.compile(r'^[`+A-Za-z0-9!@#$%^&"\'/?._-]*$')
+
+# Offset between time.monotonic() and the epoch, determined once
+_EPOCH_OFFSET = time.time() - time.monotonic()
+
+
+def _tag_part(s):
+    s = str(s)
+    if _TAG_PLAIN.match(s):
+        return s
+    return 'b"{}"'.format(base64.b64encode(s.encode('utf-8')).decode('ascii'))
+
+
+def metric_name(name, tags=None):
+    """
+    Return metric name with stream tags in canonical form, e.g. "latency|ST[host:web1,service:api]".
+    Tags are sorted, and categories/values with special characters are base64 encoded.
+
+    Args:
+       - name (str): base metric name
+       - tags (dict): stream tags
+    """
+    if not tags:
+        return name
+    return "{}|ST[{}]".format(name, ",".join(
+        "{}:{}".format(_tag_part(k), _tag_part(v)) for k, v in sorted(tags.items())))
+
+
+class MetricHandle(object):
+    """Handle for recording values of a single metric. Created by CirconusSubmit.metric().
+
+    Samples are stored in preallocated arrays until the next submit().
+
+    Attributes:
+       - name (str): metric name including stream tags
+       - kind (str): "n" for numeric values, "h" for Circllhist values
+    """
+
+    __slots__ = ("name", "kind", "_lock", "_ts", "_vals", "_n")
+
+    def __init__(self, name, kind="n", capacity=1024):
+        self.name = name
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        self._ts = array("d", bytes(8 * capacity))
+        self._vals = array("d", bytes(8 * capacity)) if self.kind == "n" else [None] * capacity
+        self._n = 0
+
+    def record(self, value, ts=None):
+        """
+        Record a value.
+
+        Args:
+           - value (number/Circllhist): value to record
+           - ts (number, optional): timestamp in seconds since epoch. Defaults to now.
+        """
+        if ts is None:
+            ts = _EPOCH_OFFSET + time.monotonic()
+        with self._lock:
+            n = self._n
+            if n == len(self._ts):
+                # double capacity
+                self._ts.extend(self._ts)
+                self._vals.extend(self._vals)
+            self._ts[n] = ts
+            self._vals[n] = value
+            self._n = n + 1
+
+    def _drain(self):
+        """Return recorded (timestamps, values) and reset storage"""
+        with self._lock:
+            n, ts, vals = self._n, self._ts, self._vals
+            if n == 0:
+                return (), ()
+            self._alloc(len(ts))
+        return ts[:n], vals[:n]
+
 
 class CirconusSubmit(object):
     """Create CirconusSubmit Object
 
     Args:
        - url (str, optional): URL to submit data to
+       - compress_requests (boolean, optional): gzip compress submitted batches
     """
 
-    def __init__(self, url = None):
+    def __init__(self, url = None, compress_requests = False):
         # HTTPTrap does not allow us to submit multiple values for the same metrics.  To make-up for
         # this, we keep data in multiple batches, each containing only one value per metric.
         self._batch = []
         self._url = url
         self._api = None
+        self._compress_requests = compress_requests
+        self._lock = threading.Lock()
+        self._handles = {}
 
-    def _batch_insert(self, name, val):
-        i = 0
+    def _batch_insert(self, name, val, i = 0):
         while True:
             if i >= len(self._batch):
                 self._batch.append({})
@@ -74,9 +176,11 @@ class CirconusSubmit(object):
                 break
         assert(not name in self._batch[i])
         self._batch[i][name] = val
+        return i
 
     def _batch_reset(self):
-        self._batch = []
+        with self._lock:
+            self._batch = []
 
     def auth(self, token):
         """Authenticate to the API with given token
@@ -120,7 +224,8 @@ class CirconusSubmit(object):
         if isinstance(ts, datetime):
             ts = ts.timestamp()
         data['_ts'] = int( ts * 1000 ) # convert to ms
-        self._batch_insert(name, data)
+        with self._lock:
+            self._batch_insert(name, data)
 
     def add_number(self, ts, name, value):
         """
@@ -144,8 +249,129 @@ class CirconusSubmit(object):
         """
         self._add(ts, name, { "_type" : "h", "_value" : hist.to_b64() })
 
-    def submit(self):
-        """submit a batch of data"""
-        for i, batch in enumerate(self._batch):
-            resp = requests.put(self._url, json = batch)
-            sys.stderr.write("{}/{} {} - {}\n".format(i+1, len(self._batch), resp, resp.text))
+    def add_histogram_values(self, ts, name, values, period = 60):
+        """
+        Add histograms built from arrays of raw samples to next batch.
+
+        Samples are binned in vectorized form (see circonusapi.llhist), no Circllhist
+        object is created. If ts or name are arrays, one histogram is added per
+        period and metric name.
+
+        Args:
+           - ts (number/array): Timestamp in seconds since epoch, or "now" as a string.
+             An array gives the timestamp of each sample, samples are grouped into
+             buckets of period seconds.
+           - name (str/array): Metric name, including stream tags, or metric name of each sample.
+           - values (array): sample values.
+           - period (int): bucket size in seconds, used if ts is an array.
+
+        Returns:
+           count (int): number of histograms added
+        """
+        if np is None:
+            raise ImportError("numpy not available")
+        values = np.asarray(values, dtype=float).ravel()
+        n = len(values)
+        if np.ndim(ts) == 0 and isinstance(name, str):
+            self._add(ts, name, { "_type" : "h", "_value" : llhist.encode(values) })
+            return 1
+        if np.ndim(ts) == 0:
+            ts_keys, ts_idx = np.array([ts], dtype=object), np.zeros(n, dtype=np.int64)
+        else:
+            ts = np.asarray(ts, dtype=float).ravel()
+            ts_keys, ts_idx = np.unique(ts // period * period, return_inverse=True)
+        if isinstance(name, str):
+            names, name_idx = [name], np.zeros(n, dtype=np.int64)
+        else:
+            names, name_idx = np.unique(np.asarray(name, dtype=object).astype(str), return_inverse=True)
+        if len(ts_idx) != n or len(name_idx) != n:
+            raise ValueError("ts, name and values differ in length")
+        groups = name_idx.ravel() * len(ts_keys) + ts_idx.ravel()
+        encoded = llhist.encode_groups(values, groups)
+        for group in sorted(encoded):
+            name_i, ts_i = divmod(group, len(ts_keys))
+            t = ts_keys[ts_i]
+            self._add(t if isinstance(t, (str, datetime)) else float(t), str(names[name_i]),
+                      { "_type" : "h", "_value" : encoded[group] })
+        return len(encoded)
+
+    def metric(self, name, tags = None, kind = "n", capacity = 1024):
+        """
+        Return a handle for recording values of a metric.
+
+        The canonical metric name is computed once. Recording values only stores the timestamp and
+        value in preallocated storage. Recorded values are sent once, by the next submit(), in a
+        single request for all handles. If a numeric handle recorded several values since the last
+        submit(), they are sent as array, which is recorded as histogram by the HTTPTrap check.
+
+        Handles are cached, calling metric() again with the same arguments returns the same handle.
+
+        Args:
+           - name (str): Base metric name, without stream tags
+           - tags (dict, optional): Stream tags
+           - kind (str, optional): "n" for numeric values, "h" for Circllhist values
+           - capacity (int, optional): number of values to preallocate storage for
+        """
+        full_name = metric_name(name, tags)
+        with self._lock:
+            handle = self._handles.get((full_name, kind))
+            if handle is None:
+                handle = self._handles[(full_name, kind)] = MetricHandle(full_name, kind, capacity)
+            return handle
+
+    def _drain_handles(self):
+        """
+        Return recorded values of all handles as a single batch.
+
+        The batch is sent by the next submit() only, it is never added to the persistent batch.
+        Multiple values of a handle are combined: numeric values are sent as array, which the
+        HTTPTrap check records as histogram, Circllhist values are merged.
+        """
+        with self._lock:
+            handles = list(self._handles.values())
+        batch = {}
+        for h in handles:
+            ts, vals = h._drain()
+            if not len(vals):
+                continue
+            if h.kind == "h":
+                v = vals[0]
+                for other in vals[1:]:
+                    v.merge(other)
+                v = v.to_b64()
+            elif len(vals) == 1:
+                v = vals[0]
+            else:
+                v = list(vals)
+            batch[h.name] = { "_type" : h.kind, "_value" : v, "_ts" : int(max(ts) * 1000) }
+        return batch
+
+    def submit(self, reset = False, timeout = None, raise_errors = False):
+        """
+        submit a batch of data
+
+        Args:
+           - reset (boolean, optional): Clear the batch, so that submitted data is not sent again
+             on the next call.
+           - timeout (float, optional): timeout of each HTTP request in seconds
+           - raise_errors (boolean, optional): raise requests.HTTPError if a batch is rejected.
+             Remaining batches are not sent.
+        """
+        handle_batch = self._drain_handles()
+        headers = { "Content-Type" : "application/json" }
+        if self._compress_requests:
+            headers["Content-Encoding"] = "gzip"
+        with self._lock:
+            batches = [ dict(b) for b in self._batch ]
+            if reset:
+                self._batch = []
+        if handle_batch:
+            batches.append(handle_batch)
+        for i, batch in enumerate(batches):
+            body = codec.dumps(batch)
+            if self._compress_requests:
+                body = codec.compress(body)
+            resp = requests.put(self._url, data = body, headers = headers, timeout = timeout)
+            sys.stderr.write("{}/{} {} - {}\n".format(i+1, len(batches), resp, resp.text))
+            if raise_errors:
+                resp.raise_for_status()
@@ -0,0 +1,164 @@
+"""
+=====
+Codec
+=====
+
+JSON serialization and HTTP content encoding helpers, shared by the
+circonusapi, circonusdata and circonussubmit modules.
+
+JSON Backends
+-------------
+
+The stdlib ``json`` module is used by default. Faster backends can be
+selected when they are installed::
+
+    from circonusapi import codec
+
+    codec.set_json_backend("orjson")  # or "ujson", "json"
+    codec.set_json_backend("auto")    # fastest available backend
+
+    # Custom backend: loads accepts bytes, dumps returns bytes or str
+    codec.set_json_backend(loads=my_loads, dumps=my_dumps)
+
+Compression
+-----------
+
+All HTTP requests negotiate gzip/deflate compressed responses.
+Request bodies are gzip compressed when ``compress_requests=True`` is passed
+to the client constructors.
+"""
+
+import json
+import zlib
+
+#
+# Optional Imports
+#
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+ACCEPT_ENCODING = "gzip, deflate"
+
+_backends = {
+    "json": (json.loads, json.dumps),
+}
+if orjson:
+    _backends["orjson"] = (orjson.loads, orjson.dumps)
+if ujson:
+    _backends["ujson"] = (ujson.loads, ujson.dumps)
+
+_loads, _dumps = _backends["json"]
+backend = "json"
+
+
+def set_json_backend(name=None, loads=None, dumps=None):
+    """
+    Select the JSON backend used for all requests and responses.
+
+    Args:
+       - name (str): "json", "orjson", "ujson" or "auto" for the fastest installed backend
+       - loads (callable): custom decode function, accepting bytes
+       - dumps (callable): custom encode function, returning str or bytes
+    """
+    global _loads, _dumps, backend
+    if loads or dumps:
+        _loads = loads or json.loads
+        _dumps = dumps or json.dumps
+        backend = name or "custom"
+        return
+    if name == "auto":
+        name = next(n for n in ["orjson", "ujson", "json"] if n in _backends)
+    if name not in _backends:
+        raise ImportError("JSON backend {} not available".format(name))
+    _loads, _dumps = _backends[name]
+    backend = name
+
+
+def loads(data):
+    """Decode JSON from bytes or str"""
+    return _loads(data)
+
+
+def dumps(obj):
+    """Encode obj as JSON bytes"""
+    data = _dumps(obj)
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return data
+
+
+def compress(data):
+    """gzip compress bytes"""
+    c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return c.compress(data) + c.flush()
+
+
+class DecompressingReader(object):
+    """File-like object that decompresses a gzip/deflate encoded stream on read()"""
+
+    def __init__(self, fh, encoding, chunk_size=65536):
+        self._fh = fh
+        self._chunk_size = chunk_size
+        self._gzip = encoding == "gzip"
+        self._dec = self._decompressobj()
+        self._started = False
+        self._eof = False
+
+    def _decompressobj(self, raw=False):
+        if self._gzip:
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        # "deflate" should be zlib wrapped, but some servers send raw deflate streams
+        return zlib.decompressobj(-zlib.MAX_WBITS if raw else zlib.MAX_WBITS)
+
+    def read(self, size=-1):
+        out = []
+        while True:
+            data = self._dec.unconsumed_tail
+            if not data:
+                if self._eof:
+                    break
+                data = self._fh.read(self._chunk_size)
+                if not data:
+                    self._eof = True
+                    out.append(self._dec.flush())
+                    break
+            try:
+                chunk = self._dec.decompress(data, size if size > 0 else 0)
+            except zlib.error:
+                if self._started or self._gzip:
+                    raise
+                self._dec = self._decompressobj(raw=True)
+                chunk = self._dec.decompress(data, size if size > 0 else 0)
+            self._started = True
+            out.append(chunk)
+            if size > 0 and chunk:
+                break
+        return b"".join(out)
+
+    def close(self):
+        self._fh.close()
+
+
+def decoding_reader(fh, encoding):
+    """
+    Wrap a file-like object, so that read() returns decompressed data.
+
+    Args:
+       - fh (file): raw response body
+       - encoding (str): value of the Content-Encoding header
+    """
+    encoding = (encoding or "identity").strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        return DecompressingReader(fh, "gzip")
+    if encoding == "deflate":
+        return DecompressingReader(fh, "deflate")
+    return fh
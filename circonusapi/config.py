@@ -1,4 +1,5 @@
 import os
+import json
 import logging
 
 try:
@@ -29,3 +30,55 @@ def load_config(configfile=None, nocache=False):
         )
     _cached_config = config
     return config
+
+
+_cached_json_config = None
+
+def load_json_config(configfile=None, nocache=False):
+    """Load connection profiles from ~/.circonusrc.json
+
+    Profiles map a name to either an API token (str), or a dict with keys
+    token / endpoint / account / baseurl / appname / submit_url.
+    """
+    global _cached_json_config
+    if _cached_json_config is not None and not nocache:
+        return _cached_json_config
+
+    configfile = configfile or os.path.expanduser('~/.circonusrc.json')
+    try:
+        with open(configfile) as fh:
+            config = json.load(fh)
+    except (IOError, OSError):
+        config = {}
+    _cached_json_config = config
+    return config
+
+def get_profile(name=None, configfile=None, json_configfile=None):
+    """Resolve a named profile to connection settings
+
+    Profiles are looked up in the JSON config first, then in the [tokens]
+    section of the INI config. If no name is given, the default_account from
+    the [general] section of the INI config is used.
+
+    Returns a dict with keys token, endpoint, account, baseurl, appname and
+    submit_url. Missing settings are None.
+    """
+    profiles = load_json_config(json_configfile)
+    profile = dict.fromkeys(
+        ['token', 'endpoint', 'account', 'baseurl', 'appname', 'submit_url'])
+    if name is not None and name in profiles:
+        cfg = profiles[name]
+        if isinstance(cfg, dict):
+            profile.update((k, cfg[k]) for k in profile if k in cfg)
+        else:
+            profile['token'] = cfg
+        return profile
+    ini = load_config(configfile)
+    if name is None and ini.has_option('general', 'default_account'):
+        name = ini.get('general', 'default_account')
+    if name is None or not ini.has_option('tokens', name):
+        raise KeyError("Unknown profile: %s" % name)
+    profile['token'] = ini.get('tokens', name)
+    if ini.has_option('general', 'appname'):
+        profile['appname'] = ini.get('general', 'appname')
+    return profile
@@ -0,0 +1,243 @@
+"""
+===========
+DF4 Decoder
+===========
+
+Incremental decoder for CAQL results in DF4 format.
+
+The decoder consumes a response body from a binary file-like object (e.g. a
+socket backed HTTP response) in fixed size chunks. The complete body is never
+held in memory, neither as bytes nor as decoded str. Numeric series can be
+written directly into preallocated ``array('d')`` buffers, which are sized from
+``head.count`` and the number of ``meta`` entries.
+
+Example
+-------
+
+::
+
+    from circonusapi import df4
+
+    with open("result.json", "rb") as fh:
+        res = df4.load(fh, numeric_arrays=True)
+
+    # res['data'][0] is an array('d'), missing values are NaN
+
+"""
+
+import io
+import json
+from array import array
+
+from . import codec
+
+_decoder = json.JSONDecoder()
+_WS = b" \t\r\n"
+NAN = float("nan")
+
+
+class DF4DecodeError(ValueError):
+    pass
+
+
+class _Reader(object):
+    """Buffered reader over a binary file-like object"""
+
+    def __init__(self, fh, chunk_size):
+        self._fh = fh
+        self._chunk_size = chunk_size
+        self.buf = b""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        """Append the next chunk to the buffer, dropping consumed bytes. Returns False on EOF."""
+        if self.eof:
+            return False
+        chunk = self._fh.read(size or self._chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next byte, b"" at EOF."""
+        while True:
+            buf, pos, n = self.buf, self.pos, len(self.buf)
+            while pos < n and buf[pos] in _WS:
+                pos += 1
+            self.pos = pos
+            if pos < n:
+                return buf[pos:pos + 1]
+            if not self.fill():
+                return b""
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise DF4DecodeError("Expected {!r} got {!r}".format(c, self.peek()))
+        self.pos += 1
+
+    def value(self):
+        """Decode the next JSON value.
+
+        Only a window of the buffer is decoded at a time. The window is grown until the value fits.
+        """
+        self.peek()
+        window = 1024
+        while True:
+            avail = len(self.buf) - self.pos
+            text = self.buf[self.pos:self.pos + window].decode("utf-8", "ignore")
+            try:
+                obj, end = _decoder.raw_decode(text)
+            except ValueError:
+                end = None
+            # A value ending at the window boundary may be truncated (e.g. a number)
+            if end is None or end == len(text):
+                if window < avail:
+                    window *= 2
+                    continue
+                if self.fill(max(window, self._chunk_size)):
+                    continue
+                if end is None:
+                    raise DF4DecodeError("Unable to decode value: {!r}".format(text[:100]))
+            self.pos += len(text[:end].encode("utf-8"))
+            return obj
+
+
+def _extend(series, seg):
+    """Parse a segment of comma separated numbers, and add it to series"""
+    if not seg.strip():
+        return
+    try:
+        vals = codec.loads(b"[" + seg + b"]")
+    except ValueError:
+        raise DF4DecodeError("Invalid numeric data: {!r}".format(seg[:100]))
+    series.extend(vals)
+
+
+class _ArraySeries(object):
+    """Preallocated float array, filled from the front"""
+
+    def __init__(self, count):
+        self.arr = array("d", [NAN]) * (count or 0)
+        self.n = 0
+
+    def extend(self, vals):
+        try:
+            vals = array("d", [NAN if v is None else v for v in vals])
+        except TypeError:
+            raise DF4DecodeError("Non-numeric value in numeric series")
+        # slice assignment grows the array if count was too small
+        self.arr[self.n:self.n + len(vals)] = vals
+        self.n += len(vals)
+
+    def result(self):
+        del self.arr[self.n:]
+        return self.arr
+
+
+class _ListSeries(object):
+
+    def __init__(self, count):
+        self.arr = []
+
+    def extend(self, vals):
+        self.arr.extend(vals)
+
+    def result(self):
+        return self.arr
+
+
+def _numeric_row(reader, series):
+    # Numeric rows contain no nested brackets, so the row ends at the next "]".
+    # Data is parsed up to the last complete value in the buffer, before reading more.
+    while True:
+        buf, pos = reader.buf, reader.pos
+        end = buf.find(b"]", pos)
+        if end >= 0:
+            reader.pos = end + 1
+            _extend(series, buf[pos:end])
+            return series.result()
+        comma = buf.rfind(b",", pos)
+        if comma >= 0:
+            reader.pos = comma + 1
+            _extend(series, buf[pos:comma])
+        if not reader.fill():
+            raise DF4DecodeError("Unexpected end of input in data row")
+
+
+def _items(reader, close):
+    """Iterate over elements of a JSON array/object, after the opening bracket was consumed"""
+    first = True
+    while True:
+        c = reader.peek()
+        if c == close:
+            reader.pos += 1
+            return
+        if not first:
+            if c != b",":
+                raise DF4DecodeError("Expected ',' got {!r}".format(c))
+            reader.pos += 1
+        first = False
+        yield
+
+
+def _data(reader, res, numeric_arrays):
+    meta = res.get("meta") or []
+    count = (res.get("head") or {}).get("count")
+    Series = _ArraySeries if numeric_arrays else _ListSeries
+    reader.pos += 1  # "["
+    rows = []
+    for _ in _items(reader, b"]"):
+        i = len(rows)
+        kind = meta[i].get("kind") if i < len(meta) else None
+        if kind == "numeric" and reader.peek() == b"[":
+            reader.pos += 1
+            rows.append(_numeric_row(reader, Series(count)))
+        else:
+            rows.append(reader.value())
+    return rows
+
+
+def load(fh, numeric_arrays=False, chunk_size=65536):
+    """
+    Decode a DF4 document from a binary file-like object.
+
+    Args:
+       - fh (file): object with a .read(size) method returning bytes
+       - numeric_arrays (boolean, optional): Return numeric series as array('d') with
+         missing values represented as NaN, instead of lists.
+       - chunk_size (int, optional): number of bytes to read at once
+
+    Returns:
+       res (dict): decoded document. Documents that are not JSON objects are returned as is.
+    """
+    reader = _Reader(fh, chunk_size)
+    if reader.peek() != b"{":
+        return reader.value()
+    reader.pos += 1
+    res = {}
+    for _ in _items(reader, b"}"):
+        key = reader.value()
+        reader.expect(b":")
+        if key == "data" and reader.peek() == b"[":
+            res[key] = _data(reader, res, numeric_arrays)
+        else:
+            res[key] = reader.value()
+    if numeric_arrays and res.get("meta") and res.get("data"):
+        # data was sent before meta, convert lists after the fact
+        for i, m in enumerate(res["meta"]):
+            if m.get("kind") == "numeric" and isinstance(res["data"][i], list):
+                series = _ArraySeries(0)
+                series.extend(res["data"][i])
+                res["data"][i] = series.result()
+    return res
+
+
+def loads(data, numeric_arrays=False):
+    """
+    Decode a DF4 document from bytes. See load().
+    """
+    return load(io.BytesIO(data), numeric_arrays=numeric_arrays)
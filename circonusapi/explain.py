@@ -0,0 +1,178 @@
+"""
+=============
+CAQL Explain
+=============
+
+Parse and aggregate CAQL explain output.
+
+CAQL queries issued with ``explain=True`` return a tree of operators with
+timing and fetch statistics in ``head.explain``. This module parses these
+trees into ExplainNode objects, and aggregates them across many queries/runs
+with ExplainProfile.
+
+Example
+-------
+
+::
+
+    from circonusapi import circonusdata, explain
+
+    circ = circonusdata.from_api(api_token)
+    profile = explain.ExplainProfile()
+    for query in queries:
+        res = circ.caql(query, start, 60, 60, explain=True, convert_hists=False)
+        profile.add(res)
+
+    # Operators with the highest total self time
+    for op in profile.top_operators(5):
+        print(op.name, op.calls, op.self_duration)
+
+    # Flame graph input, e.g. for flamegraph.pl or speedscope
+    with open("caql.folded", "w") as fh:
+        fh.write(profile.collapsed())
+
+"""
+
+
+class ExplainNode(object):
+    """Node of a CAQL explain tree
+
+    Attributes:
+       - name (str): operator name, e.g. "find"
+       - args (list): positional arguments
+       - kwargs (dict): keyword arguments
+       - putype (tuple): input and output type of the operator
+       - duration (float): time spent in this node and its children in seconds
+       - width (int): number of output streams
+       - fetch (tuple): start, period, count of fetched data
+       - children (list): child ExplainNodes
+    """
+
+    def __init__(self, tree):
+        info = tree['info']
+        stats = info.get('stats', {})
+        self.name = info['name']
+        self.args = list(info.get('args') or [])
+        self.kwargs = dict(info.get('kwargs') or {})
+        self.putype = tuple(info.get('putype') or ('', ''))
+        self.duration = stats.get('duration', 0.0)
+        self.width = stats.get('width', 0)
+        self.fetch = tuple(stats.get('fetch') or (None, None, 0))
+        self.children = [ExplainNode(c) for c in tree.get('child') or []]
+
+    @property
+    def signature(self):
+        """Operator call as string, e.g. find(duration,limit=10)"""
+        return "".join([
+            self.name, "(",
+            ",".join(str(a) for a in self.args),
+            ",",
+            "".join([str(k) + "=" + str(v) for k, v in self.kwargs.items()]),
+            ")"])
+
+    @property
+    def samples(self):
+        """Number of samples processed: width x fetched datapoints"""
+        return self.width * (self.fetch[2] or 0)
+
+    @property
+    def self_duration(self):
+        """Time spent in this node, excluding children"""
+        return max(0.0, self.duration - sum(c.duration for c in self.children))
+
+    def walk(self, path=()):
+        """Iterate over (path, node) pairs in depth-first order. path contains the names of all ancestors."""
+        path = path + (self.name,)
+        yield path, self
+        for c in self.children:
+            for item in c.walk(path):
+                yield item
+
+
+def parse(res):
+    """
+    Parse explain output.
+
+    Args:
+       - res (dict): CAQL result fetched with explain=True, or the head.explain tree itself.
+
+    Returns:
+       root (ExplainNode)
+    """
+    if 'head' in res:
+        res = res['head']['explain']
+    return ExplainNode(res)
+
+
+class OperatorStats(object):
+    """Aggregated statistics of an operator, or fetch, across many explain trees"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.duration = 0.0
+        self.self_duration = 0.0
+        self.width = 0
+        self.samples = 0
+
+    def add(self, node):
+        self.calls += 1
+        self.duration += node.duration
+        self.self_duration += node.self_duration
+        self.width += node.width
+        self.samples += node.samples
+
+    def __repr__(self):
+        return "<OperatorStats {} calls={} self_duration={:.6f}s samples={}>".format(
+            self.name, self.calls, self.self_duration, self.samples)
+
+
+class ExplainProfile(object):
+    """Aggregate explain trees of many queries/runs.
+
+    Operators are aggregated by name. Fetches (leaf nodes of the tree) are aggregated by signature.
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.duration = 0.0
+        self.operators = {}
+        self.fetches = {}
+        self._stacks = {}
+
+    def add(self, res):
+        """
+        Add explain output of a single query run.
+
+        Args:
+           - res (dict/ExplainNode): see parse()
+        """
+        root = res if isinstance(res, ExplainNode) else parse(res)
+        self.runs += 1
+        self.duration += root.duration
+        for path, node in root.walk():
+            self.operators.setdefault(node.name, OperatorStats(node.name)).add(node)
+            if not node.children:
+                sig = node.signature
+                self.fetches.setdefault(sig, OperatorStats(sig)).add(node)
+            self._stacks[path] = self._stacks.get(path, 0.0) + node.self_duration
+        return root
+
+    def top_operators(self, n=10, key="self_duration"):
+        """Return the n most expensive operators, ordered by the given OperatorStats attribute"""
+        return sorted(self.operators.values(), key=lambda s: getattr(s, key), reverse=True)[:n]
+
+    def top_fetches(self, n=10, key="samples"):
+        """Return the n most expensive fetches, ordered by the given OperatorStats attribute"""
+        return sorted(self.fetches.values(), key=lambda s: getattr(s, key), reverse=True)[:n]
+
+    def collapsed(self):
+        """
+        Return self time per call stack in collapsed stack format (one "a;b;c <microseconds>" line
+        per stack), as consumed by flame graph tools.
+        """
+        lines = []
+        for path, duration in sorted(self._stacks.items()):
+            frames = [p.replace(";", ":").replace(" ", "_") for p in path]
+            lines.append("{} {}\n".format(";".join(frames), int(round(duration * 1e6))))
+        return "".join(lines)
@@ -0,0 +1,209 @@
+"""
+==================================
+Vectorized Log-Linear Histograms
+==================================
+
+Compute circllhist bins of NumPy arrays in vectorized form, and encode them
+in the serialization format of libcircllhist (``Circllhist.to_b64()``),
+without inserting samples one by one.
+
+Bins have two significant decimal digits: a value ``x`` falls into the bin
+``(val, exp)`` with ``val / 10 * 10^exp <= |x| < (|val| + 1) / 10 * 10^exp``,
+where ``10 <= |val| <= 99`` and ``-128 <= exp <= 127``. Zero (and values too
+small to be represented) falls into the bin ``(0, 0)``. Non-finite values and
+values too large to be represented are dropped.
+
+Example
+-------
+
+::
+
+    import numpy as np
+    from circonusapi import llhist
+
+    latencies = np.random.exponential(0.1, 1000000)
+    b64 = llhist.encode(latencies)
+
+    # One histogram per group
+    encoded = llhist.encode_groups(latencies, group_ids)
+
+    # Accumulate values chunk by chunk
+    h = llhist.Histogram()
+    h.insert_many(latencies)
+    b64 = h.to_b64()
+
+Requires numpy.
+"""
+
+import base64
+import struct
+
+#
+# Optional Imports
+#
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Decimal powers of ten, parsed from literals as done by libcircllhist
+_POW10 = np.array([float("1e%d" % e) for e in range(-128, 128)]) if np is not None else None
+
+
+def _bins(values):
+    """Return (val, exp, keep) arrays for all values. keep is False for dropped values."""
+    v = np.asarray(values, dtype=float).ravel()
+    a = np.abs(v)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        e = np.floor(np.log10(a))
+    keep = np.isfinite(v) & (e <= 127)
+    zero = (a == 0) | (e < -128)
+    e = np.clip(np.where(zero | ~keep, 0, e), -128, 127).astype(np.int64)
+    with np.errstate(invalid="ignore"):
+        val = np.floor(a / _POW10[e + 128] * 10 + 1e-13)
+    val = np.where(keep, val, 0).astype(np.int64)
+    # rounding up to 100 moves the value into the next decade
+    roll = val == 100
+    keep &= ~(roll & (e == 127))
+    val = np.where(roll, 10, val)
+    e = np.where(roll, e + 1, e)
+    keep &= zero | ((val >= 10) & (val < 100))
+    val = np.where(zero, 0, np.where(v < 0, -val, val))
+    e = np.where(zero, 0, e)
+    return val, e, keep
+
+
+def bins(values):
+    """
+    Compute circllhist bins of an array of values.
+
+    Args:
+       - values (array-like): sample values
+
+    Returns:
+       (val, exp): int arrays of bin values and exponents. Dropped values are not included.
+    """
+    if np is None:
+        raise ImportError("numpy not available")
+    val, exp, keep = _bins(values)
+    return val[keep], exp[keep]
+
+
+def _bin_keys(values):
+    """
+    Encode bins as integers, ordered like the bins on the real line.
+    Returns (keys, keep), see _bins().
+    """
+    if np is None:
+        raise ImportError("numpy not available")
+    val, exp, keep = _bins(values)
+    # negative values by descending magnitude, zero, positive values by ascending magnitude
+    return np.sign(val) * ((exp + 129) * 100 + np.abs(val)), keep
+
+
+# Largest absolute bin key, see _bin_keys()
+_KEY_MAX = (127 + 129) * 100 + 99
+_KEY_SPAN = 2 * _KEY_MAX + 1
+
+
+def _unkey(key):
+    key = int(key)
+    if key == 0:
+        return 0, 0
+    sign = -1 if key < 0 else 1
+    key = abs(key)
+    return sign * (key % 100), key // 100 - 129
+
+
+def _key_bounds(keys):
+    """Return (lower edge, width) of the bins with the given keys. The zero bin has width 0."""
+    keys = np.asarray(keys, dtype=np.int64)
+    a = np.abs(keys)
+    scale = _POW10[np.clip(a // 100 - 129, -128, 127) + 128] / 10
+    width = np.where(keys == 0, 0.0, scale)
+    lower = np.where(keys < 0, -(a % 100 + 1) * scale, (a % 100) * scale)
+    return np.where(keys == 0, 0.0, lower), width
+
+
+def _serialize(keys, counts):
+    out = [struct.pack(">H", len(keys))]
+    for key, count in zip(keys, counts):
+        val, exp = _unkey(key)
+        count = int(count)
+        nbytes = max(1, (count.bit_length() + 7) // 8)
+        out.append(struct.pack(">bbB", val, exp, nbytes - 1))
+        out.append(count.to_bytes(nbytes, "big"))
+    return base64.b64encode(b"".join(out)).decode("ascii")
+
+
+def encode(values):
+    """
+    Return the base64 encoded circllhist of all values, as produced by Circllhist.to_b64()
+    """
+    keys, keep = _bin_keys(values)
+    keys, counts = np.unique(keys[keep], return_counts=True)
+    return _serialize(keys, counts)
+
+
+def encode_groups(values, groups):
+    """
+    Build one histogram per group.
+
+    Args:
+       - values (array-like): sample values
+       - groups (array-like): integer group id per sample, same length as values
+
+    Returns:
+       encoded (dict): group id -> base64 encoded histogram. Groups without any kept
+       values are omitted.
+    """
+    keys, keep = _bin_keys(values)
+    groups = np.asarray(groups, dtype=np.int64).ravel()
+    if len(groups) != len(keys):
+        raise ValueError("values and groups differ in length")
+    # pack (group, key) into a single integer, sorted by group, then key
+    packed, counts = np.unique(groups[keep] * _KEY_SPAN + (keys[keep] + _KEY_MAX),
+                               return_counts=True)
+    if not len(packed):
+        return {}
+    groups, keys = np.divmod(packed, _KEY_SPAN)
+    keys -= _KEY_MAX
+    bounds = np.flatnonzero(np.diff(groups)) + 1
+    return dict(
+        (int(g[0]), _serialize(k, c))
+        for g, k, c in zip(np.split(groups, bounds), np.split(keys, bounds), np.split(counts, bounds))
+    )
+
+
+class Histogram(object):
+    """Histogram of bin counts, filled from arrays of values.
+
+    Only the counts of non-empty bins are kept. Can be passed to CirconusSubmit.add_histogram()
+    in place of a Circllhist object.
+    """
+
+    def __init__(self):
+        if np is None:
+            raise ImportError("numpy not available")
+        self._counts = {}
+
+    def __len__(self):
+        """Number of non-empty bins"""
+        return len(self._counts)
+
+    def insert_many(self, values):
+        """Add an array of values"""
+        keys, keep = _bin_keys(values)
+        keys, counts = np.unique(keys[keep], return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self._counts[key] = self._counts.get(key, 0) + count
+
+    def count(self):
+        """Return the number of values"""
+        return sum(self._counts.values())
+
+    def to_b64(self):
+        """Return the base64 encoded histogram, see encode()"""
+        keys = sorted(self._counts)
+        return _serialize(keys, [self._counts[k] for k in keys])
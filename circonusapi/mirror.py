@@ -0,0 +1,185 @@
+"""
+=============
+Config Mirror
+=============
+
+Local SQLite mirror of account configuration.
+
+The first sync fetches all objects of the selected endpoints concurrently.
+Later syncs only fetch objects that were modified since the last sync, using
+the ``f__last_modified_gt`` search filter of the API. Deleted objects are not
+visible to incremental syncs, so a full sync is done once full_sync_interval
+has passed.
+
+Incremental syncs require a ``_last_modified`` field on the objects. Endpoints
+whose objects do not have this field (e.g. ``rule_set`` and ``graph`` in the
+v2 API at the time of writing) are fully fetched on every sync. A warning is
+logged the first time this happens for an endpoint.
+
+Example
+-------
+
+::
+
+    from circonusapi import circonusapi, mirror
+
+    api = circonusapi.CirconusAPI(token)
+    m = mirror.ConfigMirror(api, "circonus.db", endpoints=["check_bundle", "rule_set"])
+    m.sync()
+
+    # Read from the mirror instead of the network
+    bundles = m.list("check_bundle", type="dns")
+    bundle = m.get("/check_bundle/1234")
+
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import codec
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    cid TEXT PRIMARY KEY,
+    endpoint TEXT NOT NULL,
+    last_modified REAL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_endpoint ON objects (endpoint);
+CREATE TABLE IF NOT EXISTS sync_state (
+    endpoint TEXT PRIMARY KEY,
+    last_modified REAL,
+    last_full_sync REAL
+);
+"""
+
+
+class ConfigMirror(object):
+    """Mirror selected API endpoints into an SQLite database
+
+    Args:
+       - api (CirconusAPI): API used for fetching objects
+       - path (str): path of the SQLite database, created if it does not exist
+       - endpoints (list): endpoints to mirror
+       - workers (int): number of concurrent requests during sync
+       - full_sync_interval (float): seconds after which a full sync is done, to remove
+         deleted objects. None disables periodic full syncs.
+    """
+
+    def __init__(self, api, path,
+                 endpoints=("check_bundle", "rule_set", "graph", "contact_group"),
+                 workers=4, full_sync_interval=86400):
+        self._api = api
+        self.endpoints = list(endpoints)
+        self.workers = workers
+        self.full_sync_interval = full_sync_interval
+        self._lock = threading.Lock()
+        # endpoints that were reported to not support incremental syncs
+        self._warned = set()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def _state(self, endpoint):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT last_modified, last_full_sync FROM sync_state WHERE endpoint = ?",
+                (endpoint,)).fetchone()
+        return row or (None, None)
+
+    def _fetch(self, endpoint, full):
+        last_modified, last_full_sync = self._state(endpoint)
+        if last_full_sync is None or last_modified is None:
+            # never synced, or objects have no _last_modified field
+            full = True
+        elif self.full_sync_interval is not None and \
+                time.time() - last_full_sync > self.full_sync_interval:
+            full = True
+        params = {}
+        if not full:
+            # Objects modified within the same second as the last sync may have been missed
+            params["f__last_modified_gt"] = int(last_modified) - 1
+        return full, self._api.api_call("GET", endpoint, params=params)
+
+    def _store(self, endpoint, full, objs, now):
+        rows = [
+            (o["_cid"], endpoint, o.get("_last_modified"), codec.dumps(o).decode("utf-8"))
+            for o in objs
+        ]
+        with self._lock, self._db:
+            if full:
+                self._db.execute("DELETE FROM objects WHERE endpoint = ?", (endpoint,))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO objects (cid, endpoint, last_modified, body) "
+                "VALUES (?, ?, ?, ?)", rows)
+            last_modified, = self._db.execute(
+                "SELECT MAX(last_modified) FROM objects WHERE endpoint = ?",
+                (endpoint,)).fetchone()
+            self._db.execute(
+                "INSERT INTO sync_state (endpoint, last_modified, last_full_sync) VALUES (?, ?, ?) "
+                "ON CONFLICT(endpoint) DO UPDATE SET last_modified = excluded.last_modified, "
+                "last_full_sync = COALESCE(excluded.last_full_sync, last_full_sync)",
+                (endpoint, last_modified, now if full else None))
+        if rows and last_modified is None and endpoint not in self._warned:
+            self._warned.add(endpoint)
+            log.warning("Objects of %s have no _last_modified field, "
+                        "every sync of this endpoint is a full sync", endpoint)
+
+    def sync(self, full=False, endpoints=None):
+        """
+        Update the mirror.
+
+        Args:
+           - full (boolean): fetch all objects, and remove deleted objects from the mirror
+           - endpoints (list): endpoints to sync. Defaults to all mirrored endpoints.
+
+        Returns:
+           changed (dict): number of fetched objects per endpoint
+        """
+        endpoints = endpoints or self.endpoints
+        now = time.time()
+        changed = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [(e, pool.submit(self._fetch, e, full)) for e in endpoints]
+            for endpoint, fut in futures:
+                is_full, objs = fut.result()
+                self._store(endpoint, is_full, objs, now)
+                changed[endpoint] = len(objs)
+        return changed
+
+    def get(self, cid):
+        """
+        Return object with the given _cid, e.g. "/check_bundle/1234", or None.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT body FROM objects WHERE cid = ?", (cid,)).fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def list(self, endpoint, **filters):
+        """
+        Return mirrored objects of an endpoint.
+
+        Args:
+           - endpoint (str): e.g. "check_bundle"
+           - filters: only return objects with matching top-level fields,
+             e.g. list("check_bundle", type="dns")
+        """
+        sql = "SELECT body FROM objects WHERE endpoint = ?"
+        args = [endpoint]
+        for field, value in sorted(filters.items()):
+            sql += " AND json_extract(body, ?) = ?"
+            args += ["$." + field, value]
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY cid", args).fetchall()
+        return [codec.loads(r[0]) for r in rows]
+
+    def last_full_sync(self, endpoint):
+        """Return time of the last full sync of an endpoint, or None"""
+        return self._state(endpoint)[1]
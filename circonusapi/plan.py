@@ -0,0 +1,238 @@
+"""
+============
+Plan / Apply
+============
+
+Declarative configuration management on top of CirconusAPI.
+
+plan() fetches the current state of the given endpoints concurrently, and
+computes a structural diff against the desired objects. Only objects that
+differ are changed when the plan is applied.
+
+Server-managed fields (starting with ``_``) are ignored, as are fields that
+are not present in the desired object. Desired objects are matched to
+existing objects by ``_cid`` if given, or by a key field (see KEYS). A key
+matching several existing objects is an error. Edits are merged into the
+existing objects, nested fields missing in the desired object are kept.
+
+Example
+-------
+
+::
+
+    from circonusapi import circonusapi, plan
+
+    api = circonusapi.CirconusAPI(token)
+    p = plan.plan(api, {
+        "graph": [ {"title": "CPU", "datapoints": [...]} ],
+        "rule_set": [ {"check": "/check/1234", "metric_name": "duration", "rules": [...]} ],
+    })
+
+    print(p)             # dry run
+    p.apply(api)
+
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# Fields identifying objects without _cid, per endpoint
+KEYS = {
+    "check_bundle": "display_name",
+    "rule_set": ("check", "metric_name"),
+    "rule_set_group": "name",
+    "graph": "title",
+    "template": "name",
+    "contact_group": "name",
+    "worksheet": "title",
+    "dashboard": "title",
+}
+
+
+def normalize(obj):
+    """Return obj with all server-managed fields (starting with _) removed, recursively"""
+    if isinstance(obj, dict):
+        return dict((k, normalize(v)) for k, v in obj.items() if not k.startswith("_"))
+    if isinstance(obj, (list, tuple)):
+        return [normalize(v) for v in obj]
+    return obj
+
+
+def diff(current, desired, path=""):
+    """
+    Return differences between current and desired as list of (path, current, desired) tuples.
+    Fields missing in desired dicts are not compared.
+    """
+    if isinstance(current, dict) and isinstance(desired, dict):
+        out = []
+        for k in sorted(desired):
+            p = "{}.{}".format(path, k) if path else k
+            out += diff(current.get(k), desired[k], p)
+        return out
+    if isinstance(current, list) and isinstance(desired, list) and len(current) == len(desired):
+        out = []
+        for i, (c, d) in enumerate(zip(current, desired)):
+            out += diff(c, d, "{}[{}]".format(path, i))
+        return out
+    if current != desired:
+        return [(path, current, desired)]
+    return []
+
+
+def merge(current, desired):
+    """
+    Return current updated with desired, following the same rules as diff(): fields missing
+    in desired dicts keep their current value.
+    """
+    if isinstance(current, dict) and isinstance(desired, dict):
+        out = dict(current)
+        for k, v in desired.items():
+            out[k] = merge(current.get(k), v)
+        return out
+    if isinstance(current, list) and isinstance(desired, list) and len(current) == len(desired):
+        return [merge(c, d) for c, d in zip(current, desired)]
+    return desired
+
+
+def _key(endpoint, obj, key):
+    fields = key.get(endpoint, KEYS.get(endpoint, "name"))
+    if isinstance(fields, tuple):
+        return tuple(obj.get(f) for f in fields)
+    return obj.get(fields)
+
+
+class Change(object):
+    """A single change of a plan
+
+    Attributes:
+       - action (str): add, edit or delete
+       - endpoint (str): e.g. "graph"
+       - cid (str): _cid of the existing object, None for add
+       - data (dict): payload that will be sent, None for delete
+       - diff (list): (path, current, desired) differences for edits
+    """
+
+    def __init__(self, action, endpoint, cid=None, data=None, diff=None, name=None):
+        self.action = action
+        self.endpoint = endpoint
+        self.cid = cid
+        self.data = data
+        self.diff = diff or []
+        self.name = name
+
+    def __str__(self):
+        sign = {"add": "+", "edit": "~", "delete": "-"}[self.action]
+        lines = ["{} {} {} {!r}".format(sign, self.action, self.cid or self.endpoint, self.name)]
+        for path, old, new in self.diff:
+            lines.append("    {}: {!r} -> {!r}".format(path, old, new))
+        return "\n".join(lines)
+
+    def apply(self, api):
+        if self.action == "add":
+            return api.api_call("POST", self.endpoint, data=self.data)
+        if self.action == "edit":
+            return api.api_call("PUT", self.cid, data=self.data)
+        return api.api_call("DELETE", self.cid)
+
+
+class Plan(object):
+    """List of changes, computed by plan()
+
+    Attributes:
+       - changes (list): Change objects
+       - unchanged (int): number of desired objects that are already up to date
+    """
+
+    def __init__(self, changes, unchanged):
+        self.changes = changes
+        self.unchanged = unchanged
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __str__(self):
+        counts = dict((a, sum(1 for c in self.changes if c.action == a))
+                      for a in ("add", "edit", "delete"))
+        lines = [str(c) for c in self.changes]
+        lines.append("Plan: {add} to add, {edit} to change, {delete} to delete, {0} unchanged.".format(
+            self.unchanged, **counts))
+        return "\n".join(lines)
+
+    def apply(self, api, workers=8):
+        """
+        Execute all changes with bounded concurrency.
+
+        Failed changes do not abort the execution of the remaining changes.
+
+        Returns:
+           results (list): (change, response, exception) tuples
+        """
+        def run(change):
+            try:
+                return change, change.apply(api), None
+            except Exception as e:
+                log.error("Failed to %s %s: %s", change.action, change.cid or change.endpoint, e)
+                return change, None, e
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(run, self.changes))
+
+
+def plan(api, desired, key=None, prune=False, workers=8):
+    """
+    Compute the changes necessary to reach the desired state.
+
+    Args:
+       - api (CirconusAPI): API to fetch the current state from
+       - desired (dict): endpoint -> list of desired objects
+       - key (dict, optional): endpoint -> field (or tuple of fields) identifying objects.
+         Overrides KEYS.
+       - prune (boolean): delete existing objects that are not in the desired state
+       - workers (int): number of concurrent requests
+
+    Returns:
+       plan (Plan)
+    """
+    key = key or {}
+    endpoints = sorted(desired)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        current = dict(zip(endpoints, pool.map(lambda e: api.api_call("GET", e), endpoints)))
+
+    changes = []
+    unchanged = 0
+    for endpoint in endpoints:
+        by_cid = dict((o["_cid"], o) for o in current[endpoint])
+        by_key = {}
+        for o in current[endpoint]:
+            by_key.setdefault(_key(endpoint, o, key), []).append(o)
+        seen = set()
+        for obj in desired[endpoint]:
+            k = _key(endpoint, obj, key)
+            if "_cid" in obj:
+                existing = by_cid.get(obj["_cid"])
+            else:
+                matches = by_key.get(k, [])
+                if len(matches) > 1:
+                    raise ValueError("Ambiguous key {!r} for {}, matches {}".format(
+                        k, endpoint, ", ".join(o["_cid"] for o in matches)))
+                existing = matches[0] if matches else None
+            if existing is None:
+                changes.append(Change("add", endpoint, data=normalize(obj), name=k))
+                continue
+            cid = existing["_cid"]
+            if cid in seen:
+                raise ValueError("Duplicate desired object for {}".format(cid))
+            seen.add(cid)
+            d = diff(normalize(existing), normalize(obj))
+            if not d:
+                unchanged += 1
+                continue
+            # PUT requires the full object
+            data = merge(existing, normalize(obj))
+            changes.append(Change("edit", endpoint, cid=cid, data=data, diff=d, name=k))
+        if prune:
+            for cid in sorted(set(by_cid) - seen):
+                changes.append(Change("delete", endpoint, cid=cid,
+                                      name=_key(endpoint, by_cid[cid], key)))
+    return Plan(changes, unchanged)
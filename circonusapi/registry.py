@@ -0,0 +1,149 @@
+"""
+========
+Registry
+========
+
+Process-wide registry of shared client instances.
+
+Clients are resolved from named profiles (see config.get_profile) or explicit
+connection settings, and created once per process. All modules that ask for
+the same settings get the same CirconusAPI / CirconusData / CirconusSubmit
+instance, so that caches, coalescing and connection settings are shared.
+
+Example
+-------
+
+::
+
+    from circonusapi import registry
+
+    api = registry.get_api("myaccount")         # profile from ~/.circonusrc.json or ~/.circonusapirc
+    circ = registry.get_data("irondb-dev")
+    circ is registry.get_data("irondb-dev")     # True
+
+    circ = registry.get_data(endpoint="http://localhost:8112", account=1)
+
+The registry is reset in child processes after fork(), so that instances are
+never shared across processes.
+"""
+
+import os
+import threading
+
+from . import circonusapi
+from . import circonusdata
+from . import circonussubmit
+from . import config
+
+# CirconusData options that are forwarded to the shared CirconusAPI in API mode
+API_OPTIONS = ('compress_requests', 'coalesce')
+
+_lock = threading.RLock()
+_instances = {}
+_pid = os.getpid()
+
+
+def clear():
+    """Drop all registered instances"""
+    global _lock, _pid
+    # The lock may be held by another thread of the parent process after fork(),
+    # so we create a new one, rather than acquiring it.
+    _lock = threading.RLock()
+    _instances.clear()
+    _pid = os.getpid()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=clear)
+
+
+def _settings(profile, overrides):
+    if profile is None and any(v is not None for v in overrides.values()):
+        settings = dict.fromkeys(
+            ['token', 'endpoint', 'account', 'baseurl', 'appname', 'submit_url'])
+    else:
+        settings = config.get_profile(profile)
+    settings.update((k, v) for k, v in overrides.items() if v is not None)
+    return settings
+
+
+def _get(kind, settings, factory, options):
+    key = (kind, tuple(sorted(settings.items())), tuple(sorted(options.items())))
+    if _pid != os.getpid():
+        # fork() without register_at_fork support
+        clear()
+    with _lock:
+        instance = _instances.get(key)
+        if instance is None:
+            instance = _instances[key] = factory()
+        return instance
+
+
+def get_api(profile=None, token=None, baseurl=None, appname=None, **options):
+    """
+    Return the shared CirconusAPI instance for a profile/token.
+
+    Args:
+       - profile (str, optional): profile name, see config.get_profile()
+       - token (str, optional): API token, instead of a profile
+       - baseurl (str, optional): API URL
+       - appname (str, optional): appname used for authentication
+       - options: further arguments to CirconusAPI(), e.g. coalesce=True
+    """
+    s = _settings(profile, {'token': token, 'baseurl': baseurl, 'appname': appname})
+    if not s['token']:
+        raise ValueError("Profile %s has no API token" % profile)
+    s = {'token': s['token'], 'baseurl': s['baseurl'], 'appname': s['appname']}
+
+    def factory():
+        kwargs = dict((k, v) for k, v in s.items() if v is not None and k != 'token')
+        kwargs.update(options)
+        return circonusapi.CirconusAPI(s['token'], **kwargs)
+    return _get('api', s, factory, options)
+
+
+def get_data(profile=None, token=None, endpoint=None, account=None, **options):
+    """
+    Return the shared CirconusData instance for a profile, API token or IRONdb endpoint.
+
+    In API mode the instance uses the shared CirconusAPI instance from get_api(), which
+    receives the compress_requests and coalesce options.
+
+    Args:
+       - profile (str, optional): profile name, see config.get_profile()
+       - token (str, optional): API token, instead of a profile
+       - endpoint (str, optional): IRONdb endpoint, instead of a profile
+       - account (int, optional): IRONdb account id. Defaults to 1.
+       - options: further arguments to CirconusData(), e.g. coalesce=True
+    """
+    s = _settings(profile, {'token': token, 'endpoint': endpoint, 'account': account})
+    if s['token']:
+        # compression and coalescing of API requests are done by CirconusAPI
+        api_options = dict((k, v) for k, v in options.items() if k in API_OPTIONS)
+        api = get_api(token=s['token'], baseurl=s['baseurl'], appname=s['appname'],
+                      **api_options)
+        s = {'token': s['token'], 'baseurl': s['baseurl'], 'appname': s['appname']}
+        factory = lambda: circonusdata.CirconusData(api=api, **options)
+    elif s['endpoint']:
+        s = {'endpoint': s['endpoint'], 'account': s['account'] or 1}
+        factory = lambda: circonusdata.CirconusData(
+            endpoint=s['endpoint'], account=s['account'], **options)
+    else:
+        raise ValueError("Profile %s has neither token nor endpoint" % profile)
+    return _get('data', s, factory, options)
+
+
+def get_submit(profile=None, url=None, **options):
+    """
+    Return the shared CirconusSubmit instance for a profile/submission URL.
+
+    Args:
+       - profile (str, optional): profile name with a submit_url setting
+       - url (str, optional): submission URL, instead of a profile
+       - options: further arguments to CirconusSubmit()
+    """
+    s = _settings(profile, {'submit_url': url})
+    if not s['submit_url']:
+        raise ValueError("Profile %s has no submit_url" % profile)
+    s = {'submit_url': s['submit_url']}
+    factory = lambda: circonussubmit.CirconusSubmit(s['submit_url'], **options)
+    return _get('submit', s, factory, options)
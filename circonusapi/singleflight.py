@@ -0,0 +1,79 @@
+"""
+=============
+Single Flight
+=============
+
+Coalesce concurrent identical calls into a single call.
+
+While a call for a given key is in flight, further calls with the same key
+wait for it to finish and receive the same result (or exception), instead of
+issuing another request.
+
+Used by CirconusAPI and CirconusData when created with ``coalesce=True``::
+
+    api = circonusapi.CirconusAPI(token, coalesce=True)
+
+    # ... many threads calling api.list_check_bundle() ...
+
+    print(api.singleflight.calls, api.singleflight.shared)
+
+Results are shared between all waiters and must not be modified.
+"""
+
+import threading
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls with equal keys
+
+    Attributes:
+       - calls (int): number of calls that were executed
+       - shared (int): number of calls that were saved, by waiting for an in-flight call
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Call fn(*args, **kwargs), unless a call with the same key is already in flight.
+        In that case wait for the in-flight call and return its result.
+
+        Args:
+           - key (hashable): identifies equivalent calls
+           - fn (callable): function to call
+        """
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
+        return call.result
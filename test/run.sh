@@ -8,4 +8,15 @@ if python -c 'import sys; sys.exit(not sys.version_info.major == 3 )'
 then
   # python3 only tests
   python test_circonusdata.py
+  python test_df4.py
+  python test_codec.py
+  python test_explain.py
+  python test_singleflight.py
+  python test_registry.py
+  python test_mirror.py
+  python test_checkindex.py
+  python test_plan.py
+  python test_circonussubmit.py
+  python test_agent.py
+  python test_llhist.py
 fi
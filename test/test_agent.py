@@ -0,0 +1,168 @@
+"""
+Test for the agent module
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import unittest
+from unittest import TestCase
+
+from circonusapi import agent, circonussubmit, llhist
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class FakeSubmit(object):
+
+    def __init__(self):
+        self.numbers = []
+        self.submits = 0
+
+    def add_number(self, ts, name, value):
+        self.numbers.append((ts, name, value))
+
+    def add_histogram(self, ts, name, hist):
+        self.numbers.append((ts, name, hist.to_b64()))
+
+    def submit(self, reset=False, **kwargs):
+        self.submits += 1
+
+
+class FailingSubmit(FakeSubmit):
+
+    def __init__(self):
+        FakeSubmit.__init__(self)
+        self.fail = True
+
+    def submit(self, reset=False, **kwargs):
+        if self.fail:
+            self.numbers = []
+            raise ConnectionError("trap down")
+        FakeSubmit.submit(self, reset, **kwargs)
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = ""
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise circonussubmit.requests.HTTPError("%d" % self.status_code)
+
+
+class AgentTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_parse(self):
+        records = agent.parse(b"c 1.0 - requests|ST[a:b]\ng 2 120.5 queue size\nx 1 - bad\n", now=60)
+        self.assertEqual(records, [("c", 1.0, 60, "requests|ST[a:b]"), ("g", 2.0, 120.5, "queue size")])
+
+    def test_aggregate(self):
+        sub = FakeSubmit()
+        server = agent.AgentServer(sub, os.path.join(self.dir, "sock"), period=60)
+        for kind, value, ts in [("c", 1, 61), ("c", 2, 100), ("g", 4, 70), ("g", 2, 80), ("c", 5, 125)]:
+            server.add(kind, value, ts, "m")
+        self.assertEqual(server.flush(now=119), 0)
+        self.assertEqual(server.flush(now=120), 2)
+        self.assertEqual(sorted(sub.numbers), [(60, "m", 3), (60, "m", 3.0)])
+        server.flush(now=120, force=True)
+        self.assertEqual(sub.numbers[-1], (120, "m", 5))
+        # counter and gauge "m" of the same period are sent in separate requests
+        self.assertEqual(sub.submits, 3)
+
+    def test_deadline(self):
+        server = agent.AgentServer(FakeSubmit(), os.path.join(self.dir, "sock"), period=60)
+        server.add("c", 1, 130, "m")
+        server.add("c", 1, 70, "m")  # late sample reopens an older period
+        self.assertEqual(server._oldest, 60)
+        self.assertEqual(server.flush(now=125), 1)
+        self.assertEqual(server._oldest, 120)
+        self.assertEqual(server.flush(now=179), 0)
+
+    def test_submit_failure(self):
+        sub = FailingSubmit()
+        server = agent.AgentServer(sub, os.path.join(self.dir, "sock"), period=60, max_pending=2)
+        server.add("c", 1, 61, "a")
+        server.add("c", 2, 61, "b")
+        self.assertEqual(server.flush(now=120), 2)
+        self.assertEqual(len(server._pending), 2)
+        server.add("c", 3, 121, "c")
+        server.flush(now=180)
+        self.assertEqual((len(server._pending), server.dropped), (2, 1))
+        sub.fail = False
+        self.assertTrue(server._send())
+        self.assertEqual(sorted(sub.numbers), [(60, "b", 2), (120, "c", 3)])
+        self.assertEqual(server._pending, [])
+
+    def test_rejected_submission(self):
+        sub = circonussubmit.CirconusSubmit("http://localhost/")
+        server = agent.AgentServer(sub, os.path.join(self.dir, "sock"), period=60, timeout=3)
+        puts = []
+        status = [200, 500]
+        def put(url, data=None, headers=None, timeout=None):
+            puts.append((json.loads(data), timeout))
+            return FakeResponse(status.pop(0) if status else 200)
+        orig, circonussubmit.requests.put = circonussubmit.requests.put, put
+        try:
+            # two periods of the same metric need two requests, the second one is rejected
+            server.add("c", 1, 61, "a")
+            server.add("c", 2, 121, "a")
+            server.add("c", 3, 121, "b")
+            self.assertEqual(server.flush(now=180), 3)
+            self.assertEqual(len(puts), 2)
+            self.assertEqual(puts[0], ({"a": {"_type": "n", "_value": 1, "_ts": 60000},
+                                        "b": {"_type": "n", "_value": 3, "_ts": 120000}}, 3))
+            # only the rejected request is retried
+            self.assertEqual(server._pending, [((120, "c", "a"), [2, 1])])
+            self.assertTrue(server._send())
+            self.assertEqual(puts[2][0], {"a": {"_type": "n", "_value": 2, "_ts": 120000}})
+            self.assertEqual(server._pending, [])
+        finally:
+            circonussubmit.requests.put = orig
+
+    @unittest.skipIf(np is None, "numpy not available")
+    def test_histogram(self):
+        sub = FakeSubmit()
+        server = agent.AgentServer(sub, os.path.join(self.dir, "sock"), period=60)
+        for i in range(1000):
+            server.add("h", i % 3, 61, "latency")
+        buf, hist = server._acc[(60, "h", "latency")]
+        # samples are binned on arrival
+        self.assertTrue(len(buf) < agent.HISTOGRAM_BUFFER)
+        self.assertEqual(len(hist), 3)
+        server.flush(now=120)
+        self.assertEqual(sub.numbers, [(60, "latency", llhist.encode([i % 3 for i in range(1000)]))])
+
+    def test_client(self):
+        path = os.path.join(self.dir, "sock")
+        client = agent.AgentClient(path, buffer_size=1024)
+        client.counter("requests", tags={"service": "api"})
+        client.flush()
+        self.assertEqual(client.dropped, 1)  # agent not running
+
+        server = agent.AgentServer(FakeSubmit(), path)
+        server.bind()
+        client.counter("requests", tags={"service": "api"})
+        client.gauge("load", 0.5, ts=30)
+        client.flush()
+        records = agent.parse(server._sock.recv(agent.MAX_DATAGRAM), now=10)
+        self.assertEqual(records, [("c", 1.0, 10, "requests|ST[service:api]"), ("g", 0.5, 30.0, "load")])
+        client.close()
+        server.close()
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Test for the checkindex module
+"""
+import unittest
+from unittest import TestCase
+
+from circonusapi import checkindex
+
+
+def bundle(i, type, tags, metrics, brokers=("/broker/1",)):
+    return {
+        "_cid": "/check_bundle/%d" % i,
+        "type": type,
+        "target": "host%d.example.com" % i,
+        "tags": list(tags),
+        "brokers": list(brokers),
+        "metrics": [{"name": m, "type": "numeric"} for m in metrics],
+    }
+
+BUNDLES = [
+    bundle(1, "http", ["env:prod", "team:web"], ["duration", "code"]),
+    bundle(2, "http", ["env:dev"], ["duration"]),
+    bundle(3, "dns", ["env:prod"], ["rtt"], brokers=["/broker/35"]),
+    bundle(4, "httptrap", ["env:prod", "team:db"], ["duration`p99", "queries"]),
+]
+
+
+class CheckBundleIndexTestCase(TestCase):
+
+    def cids(self, index, **criteria):
+        return [b["_cid"] for b in index.search(**criteria)]
+
+    def test_search(self):
+        index = checkindex.CheckBundleIndex(BUNDLES)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(self.cids(index, tags=["env:prod"], metric="duration*"),
+                         ["/check_bundle/1", "/check_bundle/4"])
+        self.assertEqual(self.cids(index, tags=["env:prod", "team:*"], type="http*"),
+                         ["/check_bundle/1", "/check_bundle/4"])
+        self.assertEqual(self.cids(index, broker="/broker/35"), ["/check_bundle/3"])
+        self.assertEqual(self.cids(index, category="team", target="host4.*"), ["/check_bundle/4"])
+        self.assertEqual(self.cids(index, metric="nope*"), [])
+        self.assertEqual(index.values("tag", "env:*"), ["env:dev", "env:prod"])
+        self.assertEqual(len(index.search()), 4)
+
+    def test_update(self):
+        index = checkindex.CheckBundleIndex(BUNDLES)
+        index.add(bundle(2, "http", ["env:prod"], ["latency"]))
+        self.assertEqual(self.cids(index, tags=["env:dev"]), [])
+        self.assertEqual(self.cids(index, metric="lat*"), ["/check_bundle/2"])
+        self.assertEqual(self.cids(index, metric="duration"), ["/check_bundle/1"])
+        index.remove("/check_bundle/1")
+        self.assertNotIn("/check_bundle/1", index)
+        self.assertEqual(index.values("tag", "team:*"), ["team:db"])
+
+    def test_sorted_values(self):
+        index = checkindex.CheckBundleIndex()
+        for i in range(50):
+            index.add(bundle(i, "http", ["n:%02d" % (i * 7 % 50)], ["m"]))
+            if i % 3 == 0:
+                index.remove("/check_bundle/%d" % (i // 2))
+            tags = sorted(set(t for b in index.search() for t in b["tags"]))
+            self.assertEqual(index.values("tag", "n:*"), tags)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -71,6 +71,36 @@ sampleaccount=AAAAAAAA-1234-5678-9999-BBBBBBBB
             self.assertEqual(cfg.get('general', 'appname'), 'sample appname')
             self.assertEqual(cfg.get('tokens', 'sampleaccount'), 'AAAAAAAA-1234-5678-9999-BBBBBBBB')
 
+    def test_get_profile(self):
+        with NamedTemporaryFile(mode='w+') as ini_file:
+            with NamedTemporaryFile(mode='w+') as json_file:
+                ini_file.write('''
+[general]
+default_account=sampleaccount
+appname=sample appname
+
+[tokens]
+sampleaccount=AAAAAAAA-1234-5678-9999-BBBBBBBB
+''')
+                json_file.write('''{
+  "token": "CCCCCCCC-1234-5678-9999-DDDDDDDD",
+  "irondb": {"endpoint": "http://localhost:8112", "account": 2}
+}''')
+                for cfl in [ini_file, json_file]:
+                    cfl.file.flush()
+                config.load_config(configfile=ini_file.name, nocache=True)
+                config.load_json_config(configfile=json_file.name, nocache=True)
+            profile = config.get_profile()
+            self.assertEqual(profile['token'], 'AAAAAAAA-1234-5678-9999-BBBBBBBB')
+            self.assertEqual(profile['appname'], 'sample appname')
+            self.assertEqual(config.get_profile('token')['token'], 'CCCCCCCC-1234-5678-9999-DDDDDDDD')
+            profile = config.get_profile('irondb')
+            self.assertEqual((profile['endpoint'], profile['account'], profile['token']),
+                             ('http://localhost:8112', 2, None))
+            with self.assertRaises(KeyError):
+                config.get_profile('nope')
+        config.load_json_config(configfile='nope', nocache=True)
+
 
 class CirconusAPITestCase(TestCase):
 
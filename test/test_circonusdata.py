@@ -13,6 +13,16 @@ from unittest import TestCase
 
 from circonusapi import circonusdata, config
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
 class CirconusAPITestCase(TestCase):
 
     def setUp(self):
@@ -29,5 +39,124 @@ class CirconusAPITestCase(TestCase):
         self.assertEqual(len(c['data'][0]), 10)
         self.assertEqual(c['data'][0][0], 123)
 
+
+class FakeData(object):
+    """Returns series i at time t with value t + i, and a histogram series"""
+
+    def __init__(self):
+        self.calls = []
+
+    def caql(self, query, start, period, count, **kwargs):
+        self.calls.append((start, period, count))
+        return {
+            'head': {'start': start, 'period': period, 'count': count},
+            'meta': [{'kind': 'numeric', 'label': 'a'}, {'kind': 'histogram', 'label': 'h'},
+                     {'kind': 'numeric', 'label': 'b'}],
+            'data': [[start + i * period for i in range(count)], [{}] * count,
+                     [start + i * period + 1 for i in range(count)]],
+        }
+
+
+@unittest.skipIf(np is None, "numpy not available")
+class RollupCacheTestCase(TestCase):
+
+    def test_rollup(self):
+        fake = FakeData()
+        rollup = circonusdata.RollupCache(fake, base_period=60)
+        res = rollup.caql("q", 3600, 60, 120)
+        self.assertEqual([m['label'] for m in res['meta']], ['a', 'b'])
+        self.assertEqual(res['data'].shape, (2, 120))
+        res = rollup.caql("q", 3600, 600, 12, agg="min")
+        self.assertEqual(list(res['data'][0][:2]), [3600, 4200])
+        res = rollup.caql("q", 4200, 600, 2, agg="mean")
+        self.assertEqual(list(res['data'][1]), [4200 + 270 + 1, 4800 + 270 + 1])
+        res = rollup.caql("q", 3600, 3600, 2, agg="count")
+        self.assertEqual(list(res['data'][0]), [60, 60])
+        self.assertEqual((len(fake.calls), rollup.hits, rollup.misses), (1, 3, 1))
+
+    def test_extend_range(self):
+        fake = FakeData()
+        rollup = circonusdata.RollupCache(fake, base_period=60)
+        rollup.caql("q", 7200, 600, 6)
+        res = rollup.caql("q", 3600, 3600, 3, agg="max")
+        self.assertEqual(fake.calls[-1], (3600, 60, 180))
+        self.assertEqual(list(res['data'][0]), [7140, 10740, 14340])
+
+    def test_distant_range(self):
+        fake = FakeData()
+        rollup = circonusdata.RollupCache(fake, base_period=60)
+        rollup.caql("q", 7200, 600, 6)
+        rollup.caql("q", 3600, 600, 6)  # adjacent, extends the cached range
+        self.assertEqual(fake.calls[-1], (3600, 60, 120))
+        rollup.caql("q", 360000, 600, 6)  # distant, replaces the cached range
+        self.assertEqual(fake.calls[-1], (360000, 60, 60))
+        self.assertEqual(rollup._get(("base", "q"))[0], 360000)
+
+    def test_over_budget(self):
+        fake = FakeData()
+        rollup = circonusdata.RollupCache(fake, base_period=60, budget=1000)
+        res = rollup.caql("q", 0, 60, 100)
+        self.assertEqual(res['data'].shape, (2, 100))
+        self.assertEqual((rollup.nbytes, len(rollup._entries)), (0, 0))
+        rollup.caql("q", 0, 60, 100)
+        self.assertEqual(rollup.misses, 2)
+
+    def test_budget(self):
+        rollup = circonusdata.RollupCache(FakeData(), base_period=60, budget=3000)
+        rollup.caql("q", 0, 600, 10)
+        self.assertTrue(rollup.nbytes <= 3000)
+        with self.assertRaises(ValueError):
+            rollup.caql("q", 0, 90, 10)
+
+
+@unittest.skipIf(np is None or pd is None, "numpy/pandas not available")
+class CaqlDFIterTestCase(TestCase):
+
+    def setUp(self):
+        self.fake = FakeData()
+        self.circ = circonusdata.CirconusData(endpoint="http://localhost:8112")
+        self.circ.caql = self.fake.caql
+
+    def test_time_paging(self):
+        dfs = list(self.circ.caqldf_iter("q", 3600, 60, 200, max_cells=150))
+        # single datapoint probe, then 150 cells / 3 streams
+        self.assertEqual(self.fake.calls, [(3600, 60, 1), (3660, 60, 50), (6660, 60, 50),
+                                           (9660, 60, 50), (12660, 60, 49)])
+        self.assertEqual(sum(len(df) for df in dfs), 200)
+        self.assertEqual(list(pd.concat(dfs)["a"]), [3600 + i * 60 for i in range(200)])
+
+    def test_many_streams(self):
+        def caql(query, start, period, count, **kwargs):
+            self.fake.calls.append((start, period, count))
+            return {
+                'head': {'start': start, 'period': period, 'count': count},
+                'meta': [{'kind': 'numeric', 'label': str(i)} for i in range(50000)],
+                'data': np.zeros((50000, count)),
+            }
+        self.circ.caql = caql
+        dfs = list(self.circ.caqldf_iter("q", 0, 60, 100, max_cells=2**20))
+        self.assertEqual([len(df) for df in dfs], [1, 20, 20, 20, 20, 19])
+        self.assertTrue(all(df.size <= 2**20 for df in dfs))
+
+    def test_queries(self):
+        dfs = list(self.circ.caqldf_iter(["q1", "q2"], 3630, 60, 10, chunk_count=4))
+        self.assertEqual([len(df) for df in dfs], [4, 4, 2, 4, 4, 2])
+        self.assertEqual(self.fake.calls[:3], [(3600, 60, 4), (3840, 60, 4), (4080, 60, 2)])
+
+    def test_reducer(self):
+        reducer = circonusdata.StreamReducer(quantiles=[0.5, 1])
+        for df in self.circ.caqldf_iter("q", 0, 1, 1000, chunk_count=300):
+            reducer.update(df)
+        reducer.update(pd.DataFrame({"c": [-5.0, np.nan]}))
+        res = reducer.result()
+        self.assertEqual(list(res.index), ["a", "b", "c"])
+        self.assertEqual(list(res.columns), ["count", "sum", "mean", "min", "max", "p50", "p100"])
+        self.assertEqual(list(res.loc["a", ["count", "sum", "min", "max"]]), [1000, 499500, 0, 999])
+        self.assertEqual(res.loc["b", "mean"], 500.5)
+        self.assertTrue(abs(res.loc["a", "p50"] - 500) / 500 < 0.1)
+        self.assertEqual(res.loc["a", "p100"], 999)
+        self.assertEqual(list(res.loc["c", ["count", "min", "p50", "p100"]]), [1, -5, -5, -5])
+
+
 if __name__ == '__main__':
     unittest.main()
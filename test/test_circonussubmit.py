@@ -0,0 +1,65 @@
+"""
+Test for the circonussubmit module
+"""
+import json
+import time
+
+import unittest
+from unittest import TestCase
+
+from circonusapi import circonussubmit
+
+
+class FakeResponse(object):
+    status_code = 200
+    text = ""
+
+
+class CirconusSubmitTestCase(TestCase):
+
+    def test_metric_name(self):
+        self.assertEqual(circonussubmit.metric_name("foo"), "foo")
+        self.assertEqual(circonussubmit.metric_name("foo", {"b": "2", "a": 1}), "foo|ST[a:1,b:2]")
+        self.assertEqual(circonussubmit.metric_name("foo", {"url": "a,b"}), 'foo|ST[url:b"YSxi"]')
+
+    def test_handles(self):
+        sub = circonussubmit.CirconusSubmit()
+        h = sub.metric("latency", {"host": "web1"}, capacity=2)
+        self.assertIs(h, sub.metric("latency", {"host": "web1"}))
+        g = sub.metric("queue")
+        for i in range(5):
+            h.record(i, ts=10 + i)
+        t0 = time.time()
+        g.record(99)
+        batch = sub._drain_handles()
+        self.assertEqual(batch["latency|ST[host:web1]"],
+                         {"_type": "n", "_value": [0, 1, 2, 3, 4], "_ts": 14000})
+        self.assertEqual(batch["queue"]["_value"], 99)
+        self.assertTrue(abs(batch["queue"]["_ts"] / 1000 - t0) < 1)
+        # handles are emptied after draining
+        self.assertEqual(sub._drain_handles(), {})
+        self.assertEqual(sub._batch, [])
+
+    def test_submit_handles(self):
+        sub = circonussubmit.CirconusSubmit("http://localhost/")
+        h = sub.metric("latency")
+        sub.add_number(1, "other", 5)
+        puts = []
+        def put(url, data=None, headers=None, **kwargs):
+            puts.append(json.loads(data))
+            return FakeResponse()
+        orig, circonussubmit.requests.put = circonussubmit.requests.put, put
+        try:
+            for n in range(3):
+                for i in range(5):
+                    h.record(i)
+                sub.submit()
+        finally:
+            circonussubmit.requests.put = orig
+        # the persistent batch is resent, handle values are sent once, in a single request
+        self.assertEqual(len(puts), 6)
+        self.assertEqual([sorted(p) for p in puts], [["other"], ["latency"]] * 3)
+        self.assertTrue(all(p["latency"]["_value"] == [0, 1, 2, 3, 4] for p in puts[1::2]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Test for the codec module
+"""
+import io
+import zlib
+
+import unittest
+from unittest import TestCase
+
+from circonusapi import codec, df4
+
+
+class CodecTestCase(TestCase):
+
+    def tearDown(self):
+        codec.set_json_backend("json")
+
+    def test_gzip_roundtrip(self):
+        data = b'{"a": [1, 2, 3]}' * 1000
+        reader = codec.decoding_reader(io.BytesIO(codec.compress(data)), "gzip")
+        self.assertEqual(reader.read(), data)
+
+    def test_chunked_read(self):
+        data = b'{"data": [[' + b",".join(b"%d" % i for i in range(5000)) + b']]}'
+        reader = codec.DecompressingReader(io.BytesIO(codec.compress(data)), "gzip", chunk_size=7)
+        out = []
+        while True:
+            chunk = reader.read(100)
+            if not chunk:
+                break
+            self.assertTrue(len(chunk) <= 100)
+            out.append(chunk)
+        self.assertEqual(b"".join(out), data)
+
+    def test_deflate(self):
+        data = b'[1, 2, 3]'
+        raw = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        for body in [zlib.compress(data), raw.compress(data) + raw.flush()]:
+            self.assertEqual(codec.decoding_reader(io.BytesIO(body), "deflate").read(), data)
+
+    def test_identity(self):
+        fh = io.BytesIO(b"[]")
+        self.assertIs(codec.decoding_reader(fh, None), fh)
+
+    def test_backends(self):
+        for name in ["json", "auto"]:
+            codec.set_json_backend(name)
+            self.assertEqual(codec.dumps({"a": 1}).replace(b" ", b""), b'{"a":1}')
+            self.assertEqual(codec.loads(b'{"a": 1}'), {"a": 1})
+            self.assertEqual(df4.loads(b'{"meta":[{"kind":"numeric"}],"data":[[1,null]]}')["data"],
+                             [[1, None]])
+        with self.assertRaises(ImportError):
+            codec.set_json_backend("nope")
+
+    def test_custom_backend(self):
+        codec.set_json_backend(dumps=lambda obj: "custom")
+        self.assertEqual(codec.dumps({}), b"custom")
+        self.assertEqual(codec.backend, "custom")
+
+
+if __name__ == '__main__':
+    unittest.main()
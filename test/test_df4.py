@@ -0,0 +1,69 @@
+"""
+Test for the df4 module
+"""
+import io
+import json
+import math
+
+import unittest
+from unittest import TestCase
+
+from circonusapi import df4
+
+DOC = {
+    "version": "DF4",
+    "head": {"count": 5, "start": 1577836800, "period": 60},
+    "meta": [
+        {"kind": "numeric", "label": "A ä"},
+        {"kind": "histogram", "label": "B"},
+        {"kind": "numeric", "label": "C"},
+    ],
+    "data": [
+        [1, 2.5, None, -4e-3, 5],
+        [{"+10e-1": 3}, None, {}, {"+20e-1": 1}, None],
+        [],
+    ]
+}
+
+
+class DF4TestCase(TestCase):
+
+    def load(self, doc, chunk_size, **kwargs):
+        body = json.dumps(doc, indent=1).encode("utf-8")
+        return df4.load(io.BytesIO(body), chunk_size=chunk_size, **kwargs)
+
+    def test_lists(self):
+        for chunk_size in [1, 3, 7, 65536]:
+            self.assertEqual(self.load(DOC, chunk_size), DOC)
+
+    def test_arrays(self):
+        for chunk_size in [1, 5, 65536]:
+            res = self.load(DOC, chunk_size, numeric_arrays=True)
+            self.assertEqual(list(res["data"][0][:2]), [1, 2.5])
+            self.assertTrue(math.isnan(res["data"][0][2]))
+            self.assertEqual(len(res["data"][0]), 5)
+            self.assertEqual(res["data"][1], DOC["data"][1])
+            self.assertEqual(len(res["data"][2]), 0)
+
+    def test_long_series(self):
+        doc = dict(DOC, head={"count": 3}, meta=[{"kind": "numeric"}], data=[list(range(1000))])
+        res = self.load(doc, 16, numeric_arrays=True)
+        self.assertEqual(list(res["data"][0]), list(range(1000)))
+
+    def test_data_before_meta(self):
+        body = b'{"data": [[1, null]], "meta": [{"kind": "numeric"}], "head": {"count": 2}}'
+        res = df4.loads(body, numeric_arrays=True)
+        self.assertEqual(res["data"][0][0], 1)
+        self.assertTrue(math.isnan(res["data"][0][1]))
+
+    def test_not_df4(self):
+        self.assertEqual(df4.loads(b'[1, 2]'), [1, 2])
+        self.assertEqual(df4.loads(b'{"success": false}'), {"success": False})
+
+    def test_truncated(self):
+        with self.assertRaises(df4.DF4DecodeError):
+            df4.loads(b'{"meta": [{"kind": "numeric"}], "data": [[1, 2')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Test for the explain module
+"""
+import unittest
+from unittest import TestCase
+
+from circonusapi import explain
+
+
+def node(name, duration, width, count, child=(), **info):
+    info.update({
+        "name": name,
+        "putype": ["-", "n"],
+        "stats": {"duration": duration, "width": width, "fetch": [0, 60, count]},
+    })
+    return {"info": info, "child": list(child)}
+
+RES = {
+    "head": {
+        "explain": node("top", 0.010, 1, 10, [
+            node("find", 0.006, 5, 10, args=["duration"], kwargs=[["limit", 10]]),
+            node("find", 0.001, 2, 10, args=["requests"]),
+        ])
+    }
+}
+
+
+class ExplainTestCase(TestCase):
+
+    def test_parse(self):
+        root = explain.parse(RES)
+        self.assertEqual(root.name, "top")
+        self.assertAlmostEqual(root.self_duration, 0.003)
+        self.assertEqual(root.children[0].signature, "find(duration,limit=10)")
+        self.assertEqual(root.children[0].samples, 50)
+        self.assertEqual([p for p, _ in root.walk()],
+                         [("top",), ("top", "find"), ("top", "find")])
+
+    def test_profile(self):
+        profile = explain.ExplainProfile()
+        profile.add(RES)
+        profile.add(RES["head"]["explain"])
+        self.assertEqual(profile.runs, 2)
+        top = profile.top_operators(1)[0]
+        self.assertEqual((top.name, top.calls, top.samples), ("find", 4, 140))
+        self.assertEqual(profile.top_fetches(1)[0].name, "find(duration,limit=10)")
+        self.assertEqual(profile.collapsed(), "top 6000\ntop;find 14000\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Test for the llhist module
+"""
+import base64
+import struct
+import unittest
+from unittest import TestCase
+
+from circonusapi import circonussubmit, llhist
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def decode(b64):
+    """Return {(val, exp): count} of a serialized histogram"""
+    data = base64.b64decode(b64)
+    n, = struct.unpack(">H", data[:2])
+    out, pos = {}, 2
+    for _ in range(n):
+        val, exp, nbytes = struct.unpack(">bbB", data[pos:pos + 3])
+        pos += 3
+        out[(val, exp)] = int.from_bytes(data[pos:pos + nbytes + 1], "big")
+        pos += nbytes + 1
+    assert pos == len(data)
+    return out
+
+
+@unittest.skipIf(np is None, "numpy not available")
+class LLHistTestCase(TestCase):
+
+    def test_bins(self):
+        val, exp = llhist.bins([1, 2.5, 0.5, -3, 0, 1234.5, 0.1, 99.99, -0.000123])
+        self.assertEqual(list(zip(val, exp)), [
+            (10, 0), (25, 0), (50, -1), (-30, 0), (0, 0), (12, 3), (10, -1), (99, 1), (-12, -4)
+        ])
+
+    def test_bins_edge_cases(self):
+        # too small values go to the zero bin, non-finite and too large values are dropped
+        val, exp = llhist.bins([1e-200, float("nan"), float("inf"), 1e200, 1e127, 1.5e-128, 9.9e-129])
+        self.assertEqual(list(zip(val, exp)), [(0, 0), (10, 127), (15, -128), (0, 0)])
+
+    def test_encode(self):
+        self.assertEqual(llhist.encode([1]), "AAEKAAAB")
+        self.assertEqual(llhist.encode([]), "AAA=")
+        self.assertEqual(decode(llhist.encode([-3, 0, 1, 1, 1] + [5] * 300)), {
+            (-30, 0): 1, (0, 0): 1, (10, 0): 3, (50, 0): 300
+        })
+
+    def test_encode_groups(self):
+        encoded = llhist.encode_groups([1, 2, 3, float("nan"), 300], [0, 0, 1, 2, 1])
+        self.assertEqual(sorted(encoded), [0, 1])
+        self.assertEqual(decode(encoded[0]), {(10, 0): 1, (20, 0): 1})
+        self.assertEqual(decode(encoded[1]), {(30, 0): 1, (30, 2): 1})
+        with self.assertRaises(ValueError):
+            llhist.encode_groups([1, 2], [0])
+
+    def test_histogram(self):
+        h = llhist.Histogram()
+        h.insert_many([1, 2, 2])
+        h.insert_many([2, -3, float("nan")])
+        self.assertEqual((len(h), h.count()), (3, 5))
+        self.assertEqual(h.to_b64(), llhist.encode([1, 2, 2, 2, -3]))
+
+    def test_add_histogram_values(self):
+        sub = circonussubmit.CirconusSubmit("http://localhost/")
+        self.assertEqual(sub.add_histogram_values(120, "a", np.arange(10)), 1)
+        self.assertEqual(decode(sub._batch[0]["a"]["_value"])[(0, 0)], 1)
+        sub = circonussubmit.CirconusSubmit("http://localhost/")
+        n = sub.add_histogram_values(
+            np.array([0, 30, 61, 125]), np.array(["a", "b", "a", "a"]), [1, 1, 2, 3], period=60)
+        self.assertEqual(n, 4)
+        got = sorted((name, m["_ts"], decode(m["_value"]))
+                     for batch in sub._batch for name, m in batch.items())
+        self.assertEqual(got, [
+            ("a", 0, {(10, 0): 1}),
+            ("a", 60000, {(20, 0): 1}),
+            ("a", 120000, {(30, 0): 1}),
+            ("b", 0, {(10, 0): 1}),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
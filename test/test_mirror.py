@@ -0,0 +1,77 @@
+"""
+Test for the mirror module
+"""
+import os
+import shutil
+import tempfile
+
+import unittest
+from unittest import TestCase
+
+from circonusapi import mirror
+
+
+class FakeAPI(object):
+    """Serves objects from a dict, supports the f__last_modified_gt filter"""
+
+    def __init__(self, objs):
+        self.objs = objs
+        self.calls = []
+
+    def api_call(self, method, endpoint, data=None, params=None):
+        self.calls.append((endpoint, params))
+        since = (params or {}).get("f__last_modified_gt", -1)
+        return [ o for o in self.objs.values()
+                 if o["_cid"].startswith("/" + endpoint + "/") and o.get("_last_modified", 0) > since ]
+
+
+class ConfigMirrorTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "mirror.db")
+        self.api = FakeAPI({
+            "/check_bundle/1": {"_cid": "/check_bundle/1", "_last_modified": 100, "type": "dns"},
+            "/check_bundle/2": {"_cid": "/check_bundle/2", "_last_modified": 200, "type": "http"},
+            "/rule_set/1": {"_cid": "/rule_set/1", "_last_modified": 100, "metric_name": "foo"},
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_sync(self):
+        m = mirror.ConfigMirror(self.api, self.path, endpoints=["check_bundle", "rule_set"])
+        self.assertEqual(m.sync(), {"check_bundle": 2, "rule_set": 1})
+        self.assertEqual(m.get("/rule_set/1")["metric_name"], "foo")
+        self.assertEqual([o["_cid"] for o in m.list("check_bundle", type="dns")], ["/check_bundle/1"])
+
+        # incremental sync only fetches objects modified since the last sync (with 1s overlap)
+        self.api.objs["/check_bundle/1"] = {"_cid": "/check_bundle/1", "_last_modified": 300, "type": "tcp"}
+        del self.api.objs["/check_bundle/2"]
+        m.close()
+        m = mirror.ConfigMirror(self.api, self.path, endpoints=["check_bundle", "rule_set"])
+        self.assertEqual(m.sync(), {"check_bundle": 1, "rule_set": 1})
+        self.assertIn(("check_bundle", {"f__last_modified_gt": 199}), self.api.calls)
+        self.assertEqual(m.get("/check_bundle/1")["type"], "tcp")
+        self.assertEqual(len(m.list("check_bundle")), 2)
+
+        # full sync removes deleted objects
+        m.sync(full=True)
+        self.assertEqual(len(m.list("check_bundle")), 1)
+        self.assertIsNone(m.get("/check_bundle/2"))
+        self.assertIsNotNone(m.last_full_sync("check_bundle"))
+
+    def test_no_last_modified(self):
+        self.api.objs["/graph/1"] = {"_cid": "/graph/1", "title": "CPU"}
+        m = mirror.ConfigMirror(self.api, self.path, endpoints=["graph"])
+        with self.assertLogs("circonusapi.mirror", "WARNING") as logs:
+            m.sync()
+            m.sync()
+        # every sync is a full sync, the warning is logged once
+        self.assertEqual(self.api.calls, [("graph", {}), ("graph", {})])
+        self.assertEqual(len(logs.output), 1)
+        self.assertEqual(m.get("/graph/1")["title"], "CPU")
+
+
+if __name__ == '__main__':
+    unittest.main()
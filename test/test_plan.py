@@ -0,0 +1,80 @@
+"""
+Test for the plan module
+"""
+import unittest
+from unittest import TestCase
+
+from circonusapi import plan
+
+
+class FakeAPI(object):
+
+    def __init__(self, objs):
+        self.objs = objs
+        self.calls = []
+
+    def api_call(self, method, endpoint, data=None, params=None):
+        self.calls.append((method, endpoint, data))
+        if method == "GET":
+            return [o for o in self.objs if o["_cid"].startswith("/" + endpoint + "/")]
+        return data or {}
+
+
+CURRENT = [
+    {"_cid": "/graph/a", "_created": 1, "title": "CPU", "style": "line", "datapoints": [{"axis": "l"}]},
+    {"_cid": "/graph/b", "_created": 1, "title": "Memory", "style": "line", "datapoints": []},
+    {"_cid": "/graph/c", "_created": 1, "title": "Disk", "style": "area", "datapoints": []},
+    {"_cid": "/rule_set/1", "check": "/check/1", "metric_name": "duration", "rules": [{"value": 1}]},
+]
+
+
+class PlanTestCase(TestCase):
+
+    def test_plan(self):
+        api = FakeAPI(CURRENT)
+        p = plan.plan(api, {
+            "graph": [
+                {"title": "CPU", "datapoints": [{"axis": "l"}]},              # unchanged
+                {"_cid": "/graph/b", "title": "Memory", "style": "area"},     # edit by _cid
+                {"title": "Network", "style": "line"},                        # add
+            ],
+            "rule_set": [
+                {"check": "/check/1", "metric_name": "duration", "rules": [{"value": 2}],
+                 "_last_modified": 2},
+            ],
+        }, prune=True)
+        self.assertEqual(p.unchanged, 1)
+        self.assertEqual([(c.action, c.cid) for c in p.changes], [
+            ("edit", "/graph/b"), ("add", None), ("delete", "/graph/c"), ("edit", "/rule_set/1")])
+        self.assertEqual(p.changes[0].diff, [("style", "line", "area")])
+        self.assertEqual(p.changes[3].diff, [("rules[0].value", 1, 2)])
+        self.assertEqual(p.changes[0].data["_created"], 1)
+        self.assertIn("1 to add, 2 to change, 1 to delete, 1 unchanged", str(p))
+
+        results = p.apply(api, workers=2)
+        self.assertTrue(all(e is None for _, _, e in results))
+        self.assertEqual(sorted((m, e) for m, e, _ in api.calls if m != "GET"), [
+            ("DELETE", "/graph/c"), ("POST", "graph"), ("PUT", "/graph/b"), ("PUT", "/rule_set/1")])
+
+    def test_partial_nested(self):
+        api = FakeAPI([{"_cid": "/check_bundle/1", "display_name": "web",
+                        "config": {"url": "http://a", "method": "GET", "secret": "s"}}])
+        p = plan.plan(api, {"check_bundle": [{"display_name": "web", "config": {"url": "http://b"}}]})
+        self.assertEqual(p.changes[0].diff, [("config.url", "http://a", "http://b")])
+        self.assertEqual(p.changes[0].data["config"],
+                         {"url": "http://b", "method": "GET", "secret": "s"})
+
+    def test_ambiguous_key(self):
+        api = FakeAPI(CURRENT + [{"_cid": "/graph/d", "title": "CPU", "datapoints": []}])
+        with self.assertRaises(ValueError):
+            plan.plan(api, {"graph": [{"title": "CPU"}]}, prune=True)
+        # unambiguous when matched by _cid
+        p = plan.plan(api, {"graph": [{"_cid": "/graph/d", "title": "CPU"}]})
+        self.assertEqual(p.unchanged, 1)
+
+    def test_normalize(self):
+        self.assertEqual(plan.normalize({"_cid": 1, "a": [{"_x": 1, "b": 2}]}), {"a": [{"b": 2}]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""
+Test for the registry module
+"""
+import os
+
+import unittest
+from unittest import TestCase
+
+from circonusapi import registry
+
+
+class RegistryTestCase(TestCase):
+
+    def tearDown(self):
+        registry.clear()
+
+    def test_shared_instances(self):
+        circ = registry.get_data(endpoint="http://localhost:8112", account=2)
+        self.assertIs(circ, registry.get_data(endpoint="http://localhost:8112", account=2))
+        self.assertIsNot(circ, registry.get_data(endpoint="http://localhost:8112", account=3))
+        self.assertIsNot(circ, registry.get_data(endpoint="http://localhost:8112", account=2,
+                                                 coalesce=True))
+
+    def test_api_mode(self):
+        api = registry.get_api(token="AAAAAAAA")
+        circ = registry.get_data(token="AAAAAAAA")
+        self.assertIs(circ._api, api)
+        sub = registry.get_submit(url="https://trap.example.com/module/httptrap/1/x")
+        self.assertIs(sub, registry.get_submit(url="https://trap.example.com/module/httptrap/1/x"))
+
+    def test_api_options(self):
+        circ = registry.get_data(token="AAAAAAAA", compress_requests=True, coalesce=True)
+        self.assertTrue(circ._api.compress_requests)
+        self.assertIsNotNone(circ._api.singleflight)
+        self.assertIs(circ._api, registry.get_api(token="AAAAAAAA", compress_requests=True,
+                                                  coalesce=True))
+        self.assertIsNot(circ._api, registry.get_api(token="AAAAAAAA"))
+        api = registry.get_api(token="AAAAAAAA", appname="myapp")
+        self.assertEqual(api.appname, "myapp")
+
+    @unittest.skipIf(not hasattr(os, 'fork'), "fork not available")
+    def test_fork(self):
+        api = registry.get_api(token="AAAAAAAA")
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(w, b"1" if registry.get_api(token="AAAAAAAA") is api else b"0")
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(os.read(r, 1), b"0")
+
+
+if __name__ == '__main__':
+    unittest.main()
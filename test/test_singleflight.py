@@ -0,0 +1,88 @@
+"""
+Test for the singleflight module
+"""
+import threading
+import time
+
+import unittest
+from unittest import TestCase
+
+from circonusapi import circonusapi, circonusdata, singleflight
+
+
+class SingleFlightTestCase(TestCase):
+
+    def run_concurrent(self, sf, n, fn):
+        results = []
+        def worker():
+            try:
+                results.append(sf.do("key", fn))
+            except Exception as e:
+                results.append(e)
+        threads = [threading.Thread(target=worker) for _ in range(n)]
+        for t in threads:
+            t.start()
+        return threads, results
+
+    def test_coalesce(self):
+        sf = singleflight.SingleFlight()
+        release = threading.Event()
+        def fn():
+            release.wait()
+            return {"a": 1}
+        threads, results = self.run_concurrent(sf, 5, fn)
+        while sf.shared < 4:
+            time.sleep(0.001)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual((sf.calls, sf.shared), (1, 4))
+        self.assertTrue(all(r is results[0] for r in results))
+        # no call in flight, next call is executed
+        self.assertEqual(sf.do("key", lambda: 2), 2)
+        self.assertEqual(sf.calls, 2)
+
+    def test_error(self):
+        sf = singleflight.SingleFlight()
+        release = threading.Event()
+        def fn():
+            release.wait()
+            raise KeyError("boom")
+        threads, results = self.run_concurrent(sf, 3, fn)
+        while sf.shared < 2:
+            time.sleep(0.001)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertTrue(all(isinstance(r, KeyError) for r in results))
+
+    def test_api_caql(self):
+        api = circonusapi.CirconusAPI("AAAAAAAA", coalesce=True)
+        release = threading.Event()
+        calls = []
+        def send(method, url, data, headers, decoder):
+            calls.append(decoder)
+            release.wait()
+            return {"meta": [], "data": []}
+        api._send = send
+        circ = circonusdata.CirconusData(api=api)
+        params = {"query": "1", "start": 0, "end": 60, "period": 60, "format": "DF4"}
+        threads = [threading.Thread(target=circ._caql_request, args=(params, True))
+                   for _ in range(3)]
+        for t in threads:
+            t.start()
+        # concurrent requests with the same decoder share the in-flight request
+        deadline = time.time() + 5
+        while api.singleflight.shared < 2 and time.time() < deadline:
+            time.sleep(0.001)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        circ._caql_request(params, numeric_arrays=False)
+        self.assertEqual(len(calls), 2)
+        self.assertIsNot(calls[0], calls[1])
+
+
+if __name__ == '__main__':
+    unittest.main()